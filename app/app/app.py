@@ -66,7 +66,40 @@ def physics_controls() -> rx.Component:
             width="100%",
             variant="soft", 
         ),
+
+        rx.text(f"Volume: {State.volume}", size="1"),
+        rx.slider(
+            default_value=[1.0],
+            min=0.0, max=1.0, step=0.01,
+            on_change=State.update_volume,
+            style=styles.slider_style
+        ),
         rx.divider(margin_y="10px"),
+        rx.heading("Engine Load", size="2", color=styles.colors["accent"]),
+        rx.hstack(
+            rx.vstack(
+                rx.text("CPU", size="1", color=styles.colors["muted"]),
+                rx.text(f"{State.cpu_load}%", size="3", weight="bold"),
+                align_items="start",
+            ),
+            rx.spacer(),
+            rx.vstack(
+                rx.text("p99", size="1", color=styles.colors["muted"]),
+                rx.text(f"{State.cpu_peak}%", size="3", weight="bold"),
+            ),
+            rx.spacer(),
+            rx.vstack(
+                rx.text("Xruns", size="1", color=styles.colors["muted"]),
+                rx.text(State.xruns, size="3", weight="bold"),
+            ),
+            rx.spacer(),
+            rx.vstack(
+                rx.text("Players", size="1", color=styles.colors["muted"]),
+                rx.text(State.sessions, size="3", weight="bold"),
+                align_items="end",
+            ),
+            width="100%",
+        ),
         style=styles.card_style,
         width="100%",
 
@@ -156,7 +189,8 @@ def index() -> rx.Component:
                     width="100%"
                 ),
                 
-                on_mount=State.on_load,
+                on_mount=[State.on_load, State.monitor_engine],
+                on_unmount=State.on_unload,
                 spacing="5",
                 padding="40px",
                 max_width="1200px",
@@ -1,7 +1,18 @@
 import sounddevice as sd
 import numpy as np 
 from .instruments.acoustic_guitar import AcousticGuitar
+from .instruments.note_cache import NoteCache
+from .instruments.sample_bank import SampleBank
+from .physics import kernels
+from .mixer import MixerEngine
+from .monitor import CallbackMonitor
+from .latency import LatencyGovernor
+from .render_ahead import RenderAhead
+from .engine_process import EngineProcess
 import threading
+import atexit
+import time
+import os
 
 class AudioManager:
     _instance = None
@@ -13,94 +24,232 @@ class AudioManager:
                 if cls._instance is None:
                     cls._instance = super(AudioManager, cls).__new__(cls)
                     cls._instance.initialized = False
+                    cls._instance.engine = None # EngineProcess when the engine runs out of process
+                    cls._instance.tap = None    # tap(block) sees every block played, e.g. a shared ring
+                    cls._instance.client_alive = None # client_alive(key) -> bool, set by the web app
         return cls._instance
 
-    def initialize(self):
+    def initialize(self, mode:str = None):
         if self.initialized:
             return
         print("Initializing Audio Manager")
         self.fs = 44100
-        self.model = AcousticGuitar()
+        # SOUND_GEN_ENGINE=process runs the engine and the stream in a worker process, this one
+        # only forwards commands and reads the published audio and meters
+        mode = mode or os.environ.get("SOUND_GEN_ENGINE", "local")
+        if mode == "process":
+            self.engine = EngineProcess(sample_rate=self.fs)
+            self.engine.start()
+            atexit.register(self.engine.stop)
+            self._start_reaper()
+            self.initialized = True
+            return
+        # SOUND_GEN_PRECISION=float32 runs the whole engine in the device's sample format
+        dtype = np.dtype(os.environ.get("SOUND_GEN_PRECISION", "float64")).type
+        # SOUND_GEN_BODY_IR=<wav> convolves with a measured body response instead of the filter body
+        body_ir = os.environ.get("SOUND_GEN_BODY_IR")
+        # SOUND_GEN_VOICES=<n> plays notes from a pool of n voices instead of one per string,
+        # SOUND_GEN_VOICE_STEALING picks which sounding voice a note takes once all are busy
+        voices = os.environ.get("SOUND_GEN_VOICES")
+        voices = int(voices) if voices else None
+        steal_policy = os.environ.get("SOUND_GEN_VOICE_STEALING", "oldest")
+        # Compile/load the DSP kernels now rather than on the first pluck
+        kernels.get_backend().warm_up()
+
+        # Every client gets its own instrument, SOUND_GEN_CPU_BUDGET (fraction of the block
+        # deadline) or SOUND_GEN_MAX_SESSIONS caps how many run at once
+        max_sessions = os.environ.get("SOUND_GEN_MAX_SESSIONS")
+        # SOUND_GEN_NOTE_CACHE_MB caps the memory of rendered notes replayed as samples, 0 turns it off
+        note_cache_mb = float(os.environ.get("SOUND_GEN_NOTE_CACHE_MB", "128"))
+        # SOUND_GEN_SAMPLE_BANK=<file> (see build_sample_bank.py) serves its notes from the start
+        bank_path = os.environ.get("SOUND_GEN_SAMPLE_BANK")
+        bank = SampleBank(bank_path) if bank_path else None
+        self.mixer = MixerEngine(
+            sample_rate=self.fs,
+            cpu_budget=float(os.environ.get("SOUND_GEN_CPU_BUDGET", "0.6")),
+            max_sessions=int(max_sessions) if max_sessions else None,
+            instrument_factory=lambda: AcousticGuitar(dtype=dtype, body_mode="Convolution" if body_ir else "Filter",
+                                                      impulse_response=body_ir, voices=voices, steal_policy=steal_policy),
+            dtype=dtype,
+            note_cache=NoteCache(max_bytes=int(note_cache_mb * 2**20), bank=bank) if note_cache_mb > 0 or bank else None,
+        )
+        self.monitor = CallbackMonitor(self.fs)
+        self.monitor.start()
+
+        # SOUND_GEN_LATENCY: "auto" sizes the device blocks from measured render cost and keeps
+        # adjusting them, a number fixes the blocksize, "default" leaves it to the driver
+        latency_mode = os.environ.get("SOUND_GEN_LATENCY", "auto")
+        # SOUND_GEN_RENDER_AHEAD_MS=<ms> moves synthesis to a producer thread that keeps that much
+        # audio buffered, the callback then only copies (the device blocksize stops mattering)
+        ahead_ms = float(os.environ.get("SOUND_GEN_RENDER_AHEAD_MS", "0"))
+        if ahead_ms and latency_mode == "auto":
+            latency_mode = "default"
+        self.governor = LatencyGovernor(self.mixer.process_block, sample_rate=self.fs)
+        self._render = self.mixer.process_block
+        self.last_sound = 0.0 # time.monotonic() of the last block that was not silent
+        sub_block = 512
+        if latency_mode == "auto":
+            probe = self.mixer.instrument_factory()
+            for freq in probe.open_frequencies:
+                probe.play(freq, 1.0, sustain_time=60.0)
+            blocksize = self.governor.calibrate(probe.process_block)
+            print(f"Blocksize {blocksize} ({self.governor.latency()*1000:.1f} ms)")
+            self._render = self.governor.process_block
+            sub_block = self.governor.sub_block
+            self._governor_stop = threading.Event()
+            threading.Thread(target=self._govern, daemon=True).start()
+        elif latency_mode == "default":
+            blocksize = 0
+        else:
+            # Rendered unsplit, so in blocks of exactly that size
+            blocksize = sub_block = int(latency_mode)
+        # Sessions are budgeted at the block size they are really rendered in
+        self.mixer.calibrate(block_size=sub_block)
+        print(f"Mixer admits {self.mixer.capacity} sessions ({self.mixer.instance_cost:.1%} of the deadline each)")
+        self.render_ahead = None
+        self.device_xruns = 0
+        if ahead_ms:
+            # The monitor then measures the producer's blocks against their duration
+            self.render_ahead = RenderAhead(self._render, sample_rate=self.fs, ahead_ms=ahead_ms,
+                                            on_block=self.monitor.record)
+            self.render_ahead.start()
+            print(f"Rendering {self.render_ahead.latency()*1000:.0f} ms ahead")
+        # Held while the stream is swapped or closed, other threads read it
+        self._stream_lock = threading.Lock()
+        self.stream = None
+        with self._stream_lock:
+            self._open_stream(blocksize)
+        self._start_reaper()
+        self.initialized = True
 
-        self.current_freq = 440.0
-        self.current_decay = 0.99
-        self.current_sustain= 4.0
+    def _open_stream(self, blocksize:int):
+        """(Re)opens the output stream, the caller holds _stream_lock."""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
         self.stream = sd.OutputStream(
             channels =2,
             samplerate = self.fs,
+            blocksize = blocksize,
+            latency = 'low' if blocksize else None,
             callback = self._audio_callback
         )
         self.stream.start()
-        self.initialized = True
-
-    def _audio_callback(self, outdata, frames, time, status):
-        if status:
-            print(status)
-        block = self.model.process_block(frames)
-        outdata[:] = block
-
-    def pluck(self):
-        if self.initialized:
-            self.model.play(self.current_freq, velocity=1.0, sustain_time = self.current_sustain)
-
-    def _perform_strum(self, note_freqs:list[float], duration:float, direction:str):
-        sorted_freqs=sorted(note_freqs)
-        if direction == 'up':
-            sorted_freqs.reverse()
-
-        num_strings = len(sorted_freqs)
-        if num_strings ==0: return
-
-        delay_per_string = duration/ max(1, num_strings -1)
-
-        import time
-        for i, freq in enumerate(sorted_freqs):
-            # Humanize velocity: 0.8 to 1.0
-            vel = np.random.uniform(0.8, 1.0)
-            if i == 0 : vel = 1.0
-
-            self.model.play(freq,vel, sustain_time=self.current_sustain)
-            if i<num_strings -1:
-                time.sleep(delay_per_string)
 
-    def strum(self, note_freqs: list[float], duration :float=0.05, direction: str = 'down'):
-        """Plays a chord (list of frequencies) simultaneously."""
+    def _govern(self, interval:float = 2.0):
+        """Reopens the stream whenever the governor moves the blocksize."""
+        while not self._governor_stop.wait(interval):
+            # Quiet when no block sounded for a whole interval
+            quiet = time.monotonic() - self.last_sound > interval
+            blocksize = self.governor.review(self.monitor.stats(), quiet=quiet)
+            if blocksize is not None:
+                with self._stream_lock:
+                    if self._governor_stop.is_set():
+                        break
+                    print(f"Blocksize -> {blocksize} ({self.governor.latency()*1000:.1f} ms)")
+                    self._open_stream(blocksize)
+                self.monitor.reset()
+
+    def _start_reaper(self):
+        # Backstop for clients that vanished without their session being closed
+        self._reaper_stop = threading.Event()
+        threading.Thread(target=self._reap_gone_clients, daemon=True).start()
+
+    def _reap_gone_clients(self, interval:float = 30.0):
+        """
+        Closes the sessions of clients client_alive says are gone. A connected client keeps its
+        session however long it only listens, idle ones are only evicted when the mixer is full.
+        """
+        while not self._reaper_stop.wait(interval):
+            if self.client_alive is None:
+                continue
+            sessions = self.engine.sessions if self.engine is not None else self.mixer.sessions
+            for key in list(sessions):
+                if not self.client_alive(key):
+                    self.close_session(key)
+
+    def _audio_callback(self, outdata, frames, time_info, status):
+        if self.render_ahead is not None:
+            self.render_ahead.pull(frames, outdata)
+            if status:
+                self.device_xruns += 1
+        else:
+            start = time.perf_counter()
+            # Every session mixed straight into the device buffer (in fixed sub-blocks under the governor)
+            self._render(frames, out=outdata)
+            self.monitor.record(frames, time.perf_counter() - start, status)
+            if outdata.any():
+                self.last_sound = time.monotonic()
+        if self.tap is not None:
+            self.tap(outdata)
+
+    def session(self, key, create:bool = True):
+        """
+        The client's instrument (opened on first use), None before initialize or when the mixer
+        is full. Out of process this is a RemoteSession with the same control methods.
+        """
+        if not self.initialized:
+            return None
+        if self.engine is not None:
+            return self.engine.session(key)
+        return self.mixer.session(key, create)
+
+    def close_session(self, key):
         if self.initialized:
-            threading.Thread(target=self._perform_strum, args=(note_freqs,duration, direction), daemon=True).start()           
-
-    def set_synthesis_mode(self, mode:str):
-        if self.initialized:
-            self.model.set_synthesis_strategy(mode)
-
-    def set_frequency(self, freq):
-        if self.initialized:
-            self.current_freq = freq
-
-    def set_sustain(self, sustain_seconds):
-        if self.initialized:
-            ss = 10*(sustain_seconds -0.5)/(0.5) +0.1
-
-            self.current_sustain = ss
-
-            for string in self.model.strings:
-                string.set_frequency(string.frequency, sustain_time=ss)
-
-    def set_resonance(self, enabled:bool):
+            if self.engine is not None:
+                self.engine.close_session(key)
+            else:
+                self.mixer.close_session(key)
+
+    def get_output(self, num_samples:int) -> np.ndarray:
+        """The last num_samples played, as published by the engine process (None in process)."""
+        if self.initialized and self.engine is not None:
+            return self.engine.audio.latest(num_samples)
+        return None
+
+    def get_performance_stats(self) -> dict:
+        """Callback load percentiles/histogram (1.0 = the block deadline) and xrun counts."""
+        if self.initialized and self.engine is not None:
+            # No histogram out of process, only the scalar meters are published
+            return self.engine.meters.read()
         if self.initialized:
-            self.model.resonance_enabled = enabled
-
-    def set_stiffness(self, stiffness_val:float):
+            stats = self.monitor.stats()
+            stats["sessions"] = len(self.mixer.sessions)
+            stats["session_capacity"] = self.mixer.capacity
+            stats["sessions_rejected"] = self.mixer.rejected
+            with self._stream_lock:
+                stats["blocksize"] = self.stream.blocksize
+            if self.mixer.note_cache is not None:
+                stats["note_cache"] = self.mixer.note_cache.stats()
+            if self.render_ahead is not None:
+                # Blocks the ring could not cover, plus whatever the device reported
+                stats["ahead_underruns"] = self.render_ahead.underruns
+                stats["xruns"] += self.render_ahead.underruns + self.device_xruns
+            return stats
+        return {}
+
+    def reset_performance_stats(self):
         if self.initialized:
-            print(f"Setting stiffness to {stiffness_val}")
-            for string in self.model.strings:
-                if hasattr(string, 'stiffness'):
-                    string.stiffness.a = stiffness_val
-                string.set_frequency(string.frequency, sustain_time = self.current_sustain)
+            if self.engine is not None:
+                self.engine.send("reset_stats")
+            else:
+                self.monitor.reset()
 
-    def get_effective_frequency(self) -> float:
-        if self.initialized:
-            return self.model.get_effective_frequency()
-        return 0.0
+    def shutdown(self):
+        if not self.initialized:
+            return
+        self._reaper_stop.set()
+        if self.engine is not None:
+            self.engine.stop()
+        else:
+            if self.render_ahead is not None:
+                self.render_ahead.stop()
+            if hasattr(self, "_governor_stop"):
+                self._governor_stop.set()
+            with self._stream_lock:
+                self.stream.stop()
+                self.stream.close()
+            self.monitor.stop()
+        self.initialized = False
 
 audio_manager = AudioManager()
-        
\ No newline at end of file
@@ -0,0 +1,76 @@
+import threading
+
+# Command opcodes
+NOTE_ON = 1
+SET_SUSTAIN = 2
+SET_STIFFNESS = 3
+SET_RESONANCE = 4
+SET_STRINGS = 5
+SET_GAIN = 6
+NOTE_SAMPLE = 7
+
+
+class CommandQueue:
+    """
+    Single-producer/single-consumer ring of preallocated command slots.
+
+    The control side fills a slot in place and then publishes it by moving the write index,
+    the audio side reads slots up to that index and then moves the read index. Each index is
+    only ever written by one side, so the consumer never locks or allocates.
+    Several control threads (UI handlers, strums) are serialized into the single producer by
+    a lock the audio thread never touches.
+    """
+    def __init__(self, capacity:int = 1024):
+        # One slot is always left empty to tell "full" from "empty"
+        self.capacity = capacity + 1
+        self._slots = [[0, None, None, None] for _ in range(self.capacity)]
+        self._write = 0
+        self._read = 0
+        self._producer_lock = threading.Lock()
+        self.dropped = 0
+
+    def push(self, opcode:int, arg0=None, arg1=None, arg2=None) -> bool:
+        """Enqueues a command, returns False (and counts a drop) if the ring is full."""
+        with self._producer_lock:
+            return self.push_unlocked(opcode, arg0, arg1, arg2)
+
+    def push_unlocked(self, opcode:int, arg0=None, arg1=None, arg2=None) -> bool:
+        """
+        push without the producer lock, for a queue whose only producer is one thread (e.g. the
+        audio thread logging to the control side), which must never wait on a lock.
+        """
+        write = self._write
+        next_write = write + 1
+        if next_write == self.capacity:
+            next_write = 0
+        if next_write == self._read:
+            self.dropped += 1
+            return False
+        slot = self._slots[write]
+        slot[0] = opcode
+        slot[1] = arg0
+        slot[2] = arg1
+        slot[3] = arg2
+        # Publish only after the slot is complete
+        self._write = next_write
+        return True
+
+    def drain(self, handler) -> int:
+        """Applies every published command as handler(opcode, arg0, arg1, arg2), returns the count."""
+        read = self._read
+        write = self._write
+        count = 0
+        while read != write:
+            slot = self._slots[read]
+            handler(slot[0], slot[1], slot[2], slot[3])
+            # Arguments stay referenced until the producer reuses the slot, so they are
+            # released on the control side rather than in the callback
+            read += 1
+            if read == self.capacity:
+                read = 0
+            count += 1
+        self._read = read
+        return count
+
+    def __len__(self):
+        return (self._write - self._read) % self.capacity
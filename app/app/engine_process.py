@@ -0,0 +1,304 @@
+"""
+Out-of-process engine.
+
+The web server and the DSP otherwise share one interpreter (and one GIL). With
+SOUND_GEN_ENGINE=process, AudioManager starts the engine (mixer, sessions and the output stream)
+in a spawned worker process and becomes a thin client:
+ - commands go over a multiprocessing Pipe as small tuples; only the control methods in
+   SESSION_METHODS are dispatched, and the engine applies them through its usual schedulers
+ - the worker publishes the audio it plays into a SharedAudioRing and the callback stats into
+   SharedMeters, both in multiprocessing.shared_memory, which the web side reads without
+   a round trip
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import threading
+import time
+import numpy as np
+
+# Control methods a client may call on its session (InstrumentSession)
+SESSION_METHODS = {"pluck", "strum", "play_sequence", "set_synthesis_mode", "set_frequency",
+                   "set_sustain", "set_resonance", "set_stiffness", "set_gain"}
+SESSION_QUERIES = {"get_effective_frequency"}
+
+METER_FIELDS = ("callbacks", "underflows", "overflows", "xruns", "deadline_misses", "load_mean",
+                "load_p50", "load_p90", "load_p99", "load_max", "sessions", "session_capacity",
+                "sessions_rejected", "blocksize")
+
+
+def _shared_block(name:str, size:int) -> shared_memory.SharedMemory:
+    """
+    Creates the block when name is None, otherwise attaches to it. Only the creator unlinks,
+    spawned children share its resource tracker, so attaching registers nothing new.
+    """
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedAudioRing:
+    """
+    The engine's output as (capacity, channels) float32 behind an int64 count of samples ever
+    written. One writer (the audio callback), any number of readers taking the latest audio.
+    """
+    def __init__(self, name:str = None, capacity:int = 44100, channels:int = 2):
+        self.capacity = capacity
+        self.shm = _shared_block(name, 8 + capacity*channels*4)
+        self.written = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((capacity, channels), dtype=np.float32, buffer=self.shm.buf, offset=8)
+        if name is None:
+            self.written[0] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, block:np.ndarray):
+        num_samples = min(len(block), self.capacity)
+        block = block[len(block) - num_samples:]
+        start = int(self.written[0]) % self.capacity
+        first = min(num_samples, self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:num_samples - first] = block[first:]
+        # Published after the samples are in place
+        self.written[0] += len(block)
+
+    def latest(self, num_samples:int) -> np.ndarray:
+        """Copy of the last num_samples written (fewer at startup)."""
+        end = int(self.written[0])
+        num_samples = min(num_samples, end, self.capacity)
+        index = np.arange(end - num_samples, end) % self.capacity
+        return self.data[index]
+
+    def close(self, unlink:bool = False):
+        self.written = self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedMeters:
+    """The engine's performance stats as one float64 per METER_FIELDS entry, behind a sequence count."""
+    def __init__(self, name:str = None):
+        self.shm = _shared_block(name, 8*(len(METER_FIELDS) + 1))
+        self.values = np.ndarray((len(METER_FIELDS) + 1,), dtype=np.float64, buffer=self.shm.buf)
+        if name is None:
+            self.values[:] = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, stats:dict):
+        # Odd sequence = write in progress, readers retry
+        self.values[0] += 1
+        for i, field in enumerate(METER_FIELDS, 1):
+            self.values[i] = stats.get(field, 0)
+        self.values[0] += 1
+
+    def read(self, retries:int = 1000) -> dict:
+        """The latest stats, {} when no try in `retries` saw a finished write (a writer that died mid-update)."""
+        for _ in range(retries):
+            seq = self.values[0]
+            snapshot = self.values[1:].copy()
+            if seq % 2 == 0 and seq == self.values[0]:
+                break
+        else:
+            return {}
+        stats = dict(zip(METER_FIELDS, snapshot.tolist()))
+        for field in ("callbacks", "underflows", "overflows", "xruns", "deadline_misses",
+                      "sessions", "session_capacity", "sessions_rejected", "blocksize"):
+            stats[field] = int(stats[field])
+        return stats
+
+    def close(self, unlink:bool = False):
+        self.values = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class RemoteSession:
+    """Stands in for an InstrumentSession living in the engine process."""
+    def __init__(self, engine, key):
+        self.engine = engine
+        self.key = key
+        self.configured = False
+
+    def _send(self, method:str, *args):
+        self.engine.send("session", self.key, method, args)
+
+    def pluck(self):
+        self._send("pluck")
+
+    def strum(self, note_freqs:list[float], duration:float = 0.05, direction:str = 'down'):
+        self._send("strum", note_freqs, duration, direction)
+
+    def play_sequence(self, strums:list[tuple]):
+        self._send("play_sequence", strums)
+
+    def set_synthesis_mode(self, mode:str):
+        self._send("set_synthesis_mode", mode)
+
+    def set_frequency(self, freq):
+        self._send("set_frequency", freq)
+
+    def set_sustain(self, sustain_seconds):
+        self._send("set_sustain", sustain_seconds)
+
+    def set_resonance(self, enabled:bool):
+        self._send("set_resonance", enabled)
+
+    def set_stiffness(self, stiffness_val:float):
+        self._send("set_stiffness", stiffness_val)
+
+    def set_gain(self, gain:float):
+        self._send("set_gain", gain)
+
+    def get_effective_frequency(self) -> float:
+        frequency = self.engine.call("query", self.key, "get_effective_frequency", ())
+        return 0.0 if frequency is None else frequency
+
+
+class EngineProcess:
+    """
+    Client side: starts the worker, forwards commands, reads its audio and meters.
+
+    Calls wait at most call_timeout seconds for their reply and give None when the worker is
+    dead or stalled, so no handler hangs on it. Replies carry the call's serial number, a
+    reply that arrives after its call gave up is dropped by the next call.
+
+    Session commands are fire-and-forget. Only the first lookup of a session is a call ("open",
+    which checks the engine's capacity), the proxy is then kept in `sessions` until the worker
+    answers a command with ("gone", key): its mixer closed or evicted the session, and the next
+    lookup opens it again.
+    """
+    def __init__(self, audio_seconds:float = 1.0, sample_rate:int = 44100, channels:int = 2,
+                 call_timeout:float = 1.0):
+        self.audio = SharedAudioRing(capacity=int(audio_seconds*sample_rate), channels=channels)
+        self.meters = SharedMeters()
+        # spawn: a fresh interpreter, nothing inherited from the web server's threads
+        context = mp.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_engine_main, daemon=True, name="sound-engine",
+                                       args=(child_conn, self.audio.name, self.audio.capacity, channels, self.meters.name))
+        self._lock = threading.Lock() # Pipe ends are not thread safe, handlers run on many threads
+        self.call_timeout = call_timeout
+        self._serial = 0
+        self.sessions = {}
+
+    def start(self, timeout:float = 120.0):
+        self.process.start()
+        if not self._conn.poll(timeout):
+            raise RuntimeError("The engine process did not start")
+        self._conn.recv()
+
+    def send(self, *message):
+        with self._lock:
+            try:
+                self._conn.send(message)
+            except OSError:
+                pass # The worker is gone, there is nobody to tell
+
+    def call(self, kind:str, *args):
+        """The worker's reply to (kind, *args), None when it does not answer in call_timeout."""
+        with self._lock:
+            self._serial += 1
+            serial = self._serial
+            deadline = time.monotonic() + self.call_timeout
+            try:
+                self._conn.send((kind, serial) + args)
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.process.is_alive() or not self._conn.poll(remaining):
+                        return None
+                    reply_serial, value = self._conn.recv()
+                    if reply_serial == "gone":
+                        self.sessions.pop(value, None)
+                    elif reply_serial == serial:
+                        return value
+            except (OSError, EOFError):
+                return None
+
+    def _read_notices(self):
+        """Takes in the ("gone", key) messages waiting on the pipe, the caller holds _lock."""
+        try:
+            while self._conn.poll(0):
+                kind, value = self._conn.recv()
+                if kind == "gone":
+                    self.sessions.pop(value, None)
+        except (OSError, EOFError):
+            pass
+
+    def session(self, key) -> RemoteSession:
+        """A proxy for key's session, None when the engine is full or not answering."""
+        with self._lock:
+            self._read_notices()
+        session = self.sessions.get(key)
+        if session is None and self.call("open", key):
+            session = self.sessions.setdefault(key, RemoteSession(self, key))
+        return session
+
+    def close_session(self, key):
+        self.sessions.pop(key, None)
+        self.send("close", key)
+
+    def stop(self):
+        if self.audio is None:
+            return
+        if self.process.is_alive():
+            self.send("quit")
+            self.process.join(5.0)
+        self.audio.close(unlink=True)
+        self.meters.close(unlink=True)
+        self.audio = self.meters = None
+
+
+def _engine_main(conn, audio_name:str, audio_capacity:int, channels:int, meter_name:str, meter_interval:float = 0.25):
+    """Worker process: an in-process AudioManager driven by the pipe."""
+    from .audio_manager import AudioManager
+    audio = SharedAudioRing(audio_name, audio_capacity, channels)
+    meters = SharedMeters(meter_name)
+    manager = AudioManager()
+    manager.tap = audio.write
+    manager.initialize(mode="local")
+    conn.send(("ready",))
+
+    stop = threading.Event()
+    def publish_meters():
+        while not stop.wait(meter_interval):
+            meters.write(manager.get_performance_stats())
+    threading.Thread(target=publish_meters, daemon=True).start()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        kind = message[0]
+        if kind == "quit":
+            break
+        elif kind == "session":
+            _, key, method, args = message
+            session = manager.session(key, create=False)
+            if session is None:
+                # Closed or evicted here, the client opens it again (through "open") on its next lookup
+                conn.send(("gone", key))
+            elif method in SESSION_METHODS:
+                getattr(session, method)(*args)
+        elif kind == "query":
+            _, serial, key, method, args = message
+            session = manager.session(key, create=False)
+            conn.send((serial, getattr(session, method)(*args) if session is not None and method in SESSION_QUERIES else 0.0))
+        elif kind == "open":
+            _, serial, key = message
+            conn.send((serial, manager.session(key) is not None))
+        elif kind == "close":
+            manager.close_session(message[1])
+        elif kind == "reset_stats":
+            manager.reset_performance_stats()
+
+    stop.set()
+    manager.shutdown()
+    audio.close()
+    meters.close()
@@ -1 +1,4 @@
 from .acoustic_guitar import AcousticGuitar
+from .voice_pool import VoicePool
+from .note_cache import NoteCache, SampleVoices
+from .sample_bank import SampleBank, build_sample_bank
@@ -1,14 +1,26 @@
 import numpy as np
 from ..physics.core import Instrument, note_to_freq, InstrumentConfig
-from ..physics.body import GuitarBody
+from ..physics.body import StereoGuitarBody, ConvolutionBody
 from ..physics.dwg import DigitalWaveguideStrategy
 from ..physics.karplus_strong import KarplusStrongAlgorithm
+from ..physics.string_bank import WaveguideBank
+from ..physics import kernels
+from .voice_pool import VoicePool
+from .note_cache import SampleVoices
 
 class AcousticGuitar(Instrument):
-    def __init__(self):
+    def __init__(self, dtype=np.float64, saturation:str = "tanh", body_mode:str = "Filter",
+                 impulse_response=None, body_block_size:int = 512, voices:int = None,
+                 polyphony:int = None, steal_policy:str = "oldest"):
+        # Processing precision of every stage (strings, body, mix), np.float32 or np.float64
+        self.dtype = dtype
         # We now import components from the physics package!
-        self.body_left = GuitarBody(sample_rate = 44100, resonance_freq=95.0)
-        self.body_right = GuitarBody(sample_rate = 44100, resonance_freq=105.0)
+        # Left/right body resonances at 95/105 Hz, rendered together
+        self.filter_body = StereoGuitarBody(sample_rate = 44100, resonance_freqs=(95.0, 105.0), saturation=saturation, dtype=dtype)
+        self.body = self.filter_body
+        self.body_mode = "Filter"
+        if body_mode != "Filter":
+            self.set_body_mode(body_mode, impulse_response, body_block_size)
         self.tuning = "C Minor"
         #Standard Tuning ["E2", "A2", "D3", "G3", "B3", "E4"]
         #C Minor Tuning ["C2","G2","C3","G3","C4","F#4"]
@@ -20,13 +32,18 @@ class AcousticGuitar(Instrument):
             case _:
                 print("Error with tuning")
                 return
+        self.tuning_notes = tuning_notes
         
         
-        self.body = GuitarBody(sample_rate=44100)
         self.strings = []
         self.last_string = None
         self.open_frequencies = [] 
         self.resonance_enabled = True
+        # Per-block scratch (mono mix, one voice), grown on demand only
+        self._mix = np.zeros(0, dtype=dtype)
+        self._voice = np.zeros(0, dtype=dtype)
+        # Strings whose whole loop decays below this level are put to sleep
+        self.silence_threshold_db = -120.0
 
         # ACOUSTIC PRESET (Default)
         acoustic_config = InstrumentConfig(
@@ -39,22 +56,72 @@ class AcousticGuitar(Instrument):
         for note in tuning_notes:
             freq = note_to_freq(note)
             self.open_frequencies.append(freq)
+
+        # Without a pool every note goes to its string's single voice. With voices=N the strings
+        # list holds N voices handed out by the pool, so notes on one string can overlap
+        num_voices = voices if voices else len(self.open_frequencies)
+        for i in range(num_voices):
             # Pass the config to the strategy
-            self.strings.append(DigitalWaveguideStrategy(sample_rate=44100, frequency=freq, config=acoustic_config))
+            freq = self.open_frequencies[i % len(self.open_frequencies)]
+            self.strings.append(DigitalWaveguideStrategy(sample_rate=44100, frequency=freq, config=acoustic_config, dtype=dtype))
+        self.voice_pool = VoicePool(self.strings, polyphony, steal_policy) if voices else None
+        self.string_bank = self.build_string_bank(self.strings)
+        # Cached notes (NoteCache) are mixed in with the strings, before the body
+        self.sample_voices = SampleVoices(16)
 
         super().__init__("Acoustic Guitar", self.strings[0])
 
     def set_synthesis_strategy(self, strategy_name:str):
         """Swaps the physics engine for all strings."""
+        self.use_strings(self.build_strings(strategy_name))
+
+    def build_strings(self, strategy_name:str) -> list:
+        """Creates a fresh set of strings for the given engine without touching the live ones."""
         new_strings = []
-        for freq in self.open_frequencies:
+        for i in range(len(self.strings)):
+            freq = self.open_frequencies[i % len(self.open_frequencies)]
             if strategy_name == "Digital Waveguide":
-                s= DigitalWaveguideStrategy(sample_rate = 44100, frequency = freq, config=self.strings[0].config)
+                s= DigitalWaveguideStrategy(sample_rate = 44100, frequency = freq, config=self.strings[0].config, dtype=self.dtype)
             elif strategy_name == "Karplus Strong":
-                s= KarplusStrongAlgorithm(sample_rate = 44100, frequency = freq, config=self.strings[0].config)
+                s= KarplusStrongAlgorithm(sample_rate = 44100, frequency = freq, config=self.strings[0].config, dtype=self.dtype)
             new_strings.append(s)
-        self.strings = new_strings
+        return new_strings
+
+    @staticmethod
+    def build_string_bank(strings:list):
+        """The WaveguideBank the NumPy backend renders these strings with, None when they need the per-string path."""
+        return WaveguideBank(strings) if WaveguideBank.supports(strings) else None
+
+    def use_strings(self, strings:list, string_bank=None):
+        """Swaps in strings (and their bank, built here when not given, see build_string_bank)."""
+        self.strings = strings
+        self.string_bank = string_bank if string_bank is not None else self.build_string_bank(strings)
         self.last_string = self.strings[0]
+        if self.voice_pool is not None:
+            self.voice_pool.use_voices(strings)
+
+    def build_body(self, mode:str, impulse_response=None, block_size:int = 512):
+        """
+        "Filter" (lowpass + Helmholtz resonators) or "Convolution" with a measured body impulse
+        response (WAV path or array), which delays the output by block_size samples.
+        """
+        if mode == "Filter":
+            return self.filter_body
+        elif mode == "Convolution":
+            if impulse_response is None:
+                raise ValueError("The convolution body needs an impulse response")
+            body = ConvolutionBody(impulse_response, sample_rate=44100, block_size=block_size, dtype=self.dtype)
+            body.silence_threshold = self.filter_body.silence_threshold
+            return body
+        raise ValueError(f"Unknown body mode '{mode}', available: ['Filter', 'Convolution']")
+
+    def use_body(self, body):
+        self.body = body
+        self.body_mode = "Filter" if body is self.filter_body else "Convolution"
+
+    def set_body_mode(self, mode:str, impulse_response=None, block_size:int = 512):
+        """Swaps the body model, see build_body."""
+        self.use_body(self.build_body(mode, impulse_response, block_size))
 
     def set_instrument_config(self, mode: str):
         if mode == "Acoustic":
@@ -76,7 +143,8 @@ class AcousticGuitar(Instrument):
             if hasattr(s, 'config'):
                 s.config = config
     
-    def play(self, target_freq:float, velocity:float, sustain_time:float=4.0):
+    def select_string(self, target_freq:float) -> int:
+        """Index of the string a note is played on: the highest open string at or below it."""
         best_string_index = 0
         min_dist = 100000.0
 
@@ -86,28 +154,96 @@ class AcousticGuitar(Instrument):
                 if dist<min_dist:
                     min_dist = dist
                     best_string_index = i
-            
-        selected_strategy = self.strings[best_string_index]
+        return best_string_index
+
+    def play(self, target_freq:float, velocity:float, sustain_time:float=4.0):
+        string_index = self.select_string(target_freq)
+        if self.voice_pool is None:
+            selected_strategy = self.strings[string_index]
+            self.sample_voices.stop_string(string_index)
+        else:
+            selected_strategy = self.strings[self.voice_pool.note_on(string_index)]
         selected_strategy.set_frequency(target_freq,sustain_time=sustain_time)
         selected_strategy.excite(velocity)
         self.last_string = selected_strategy
-        # Direct Body Kick
-        kick = np.random.uniform(-0.1,0.1,100) * velocity
-        #self.body_left.process(kick)
-        #self.body_right.process(kick)
+
+    def play_sample(self, sample:np.ndarray, gain:float, target_freq:float, sustain_time:float=4.0):
+        """Plays a cached note (rendered string output) on the string play() would have used."""
+        string_index = self.select_string(target_freq)
+        if self.voice_pool is None:
+            # The note takes over its string: silence what it played, tune it for get_effective_frequency
+            string = self.strings[string_index]
+            string.set_frequency(target_freq, sustain_time=sustain_time)
+            string.sleep()
+            self.sample_voices.stop_string(string_index)
+            self.last_string = string
+        self.sample_voices.start(sample, gain, string_index)
         
-    def process_block(self, num_samples:int):
-        raw_string_sound=np.zeros(num_samples)
-        for s in self.strings:
-            raw_string_sound += s.process(num_samples)
-        if self.resonance_enabled:
-            left = self.body_left.process(raw_string_sound)
-            right = self.body_right.process(raw_string_sound)
-            final_sound = np.vstack((left,right)).T
+    def set_silence_threshold(self, threshold_db:float):
+        self.silence_threshold_db = threshold_db
+        for body in {self.filter_body, self.body}:
+            body.silence_threshold = 10**(threshold_db/20)
+
+    def _reserve(self, num_samples:int):
+        if len(self._mix) < num_samples:
+            self._mix = np.zeros(num_samples, dtype=self.dtype)
+            self._voice = np.zeros(num_samples, dtype=self.dtype)
+
+    def _render_strings(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        active = [s for s in self.strings if s.awake]
+        if out is None:
+            raw_string_sound = np.zeros(num_samples, dtype=self.dtype)
+        else:
+            raw_string_sound = out
+            raw_string_sound[:] = 0.0
+        if not active:
+            return self._mix_samples(raw_string_sound)
+
+        # The NumPy kernels are dominated by per-chunk overhead, so waveguide strings are
+        # advanced together by the bank. Compiled backends are already cheap per string.
+        if kernels.get_backend().name == "numpy" and self.string_bank is not None:
+            self.string_bank.process(num_samples, out=raw_string_sound)
         else:
-            final_sound = np.vstack((raw_string_sound, raw_string_sound)).T
+            self._reserve(num_samples)
+            voice = self._voice[:num_samples]
+            for s in active:
+                raw_string_sound += s.process(num_samples, out=voice)
+
+        threshold = 10**(self.silence_threshold_db/20)
+        for s in active:
+            if s.get_peak_level() < threshold:
+                s.sleep()
+        return self._mix_samples(raw_string_sound)
+
+    def _mix_samples(self, raw_string_sound:np.ndarray) -> np.ndarray:
+        if self.sample_voices.count:
+            self._reserve(len(raw_string_sound))
+            self.sample_voices.mix(raw_string_sound, self._voice)
+        return raw_string_sound
 
-        return final_sound*0.4
+    def process_block(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        """
+        Renders a (num_samples, 2) stereo block. With out (e.g. the sounddevice buffer, any
+        float dtype) the block is written straight into it and nothing is allocated.
+        """
+        self._reserve(num_samples)
+        raw_string_sound = self._render_strings(num_samples, out=self._mix[:num_samples])
+        return self.apply_body(raw_string_sound, out)
+
+    def apply_body(self, raw_string_sound:np.ndarray, out:np.ndarray = None) -> np.ndarray:
+        """Mono string mix -> stereo output through the body resonators."""
+        num_samples = len(raw_string_sound)
+        if out is None:
+            out = np.empty((num_samples, 2), dtype=self.dtype)
+        if self.resonance_enabled and self.body.asleep and not raw_string_sound.any():
+            out[:] = 0.0
+            return out
+        if self.resonance_enabled:
+            self.body.process(raw_string_sound, out=out, gain=0.4)
+        else:
+            np.multiply(raw_string_sound, 0.4, out=out[:, 0])
+            out[:, 1] = out[:, 0]
+        return out
 
     def get_effective_frequency(self) -> float:
         """Returns the actual frequency of the last string played."""
@@ -0,0 +1,173 @@
+import dataclasses
+import queue
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SampleVoices:
+    """
+    Preallocated playback slots for cached notes. A slot is just (sample, position, gain,
+    string), mixing it is one scaled add per block, and a full set steals the oldest slot.
+    """
+    def __init__(self, size:int = 16):
+        self.samples = [None] * size
+        self.position = np.zeros(size, dtype=np.int64)
+        self.gain = np.zeros(size)
+        self.string_of = np.full(size, -1, dtype=np.int64)
+        self.started = np.zeros(size, dtype=np.int64)
+        self.serial = 0
+        self.count = 0
+
+    def start(self, sample:np.ndarray, gain:float, string_index:int):
+        slot = 0
+        for i, playing in enumerate(self.samples):
+            if playing is None:
+                slot = i
+                break
+            if self.started[i] < self.started[slot]:
+                slot = i
+        if self.samples[slot] is None:
+            self.count += 1
+        self.serial += 1
+        self.samples[slot] = sample
+        self.position[slot] = 0
+        self.gain[slot] = gain
+        self.string_of[slot] = string_index
+        self.started[slot] = self.serial
+
+    def stop_string(self, string_index:int):
+        """Cuts whatever plays on string_index, as a new pluck on that string would."""
+        for i, playing in enumerate(self.samples):
+            if playing is not None and self.string_of[i] == string_index:
+                self.samples[i] = None
+                self.count -= 1
+
+    def mix(self, out:np.ndarray, scratch:np.ndarray):
+        """Adds every playing sample into out, scratch is a buffer at least as long."""
+        for i, sample in enumerate(self.samples):
+            if sample is None:
+                continue
+            start = self.position[i]
+            n = min(len(out), len(sample) - start)
+            np.multiply(sample[start:start + n], self.gain[i], out=scratch[:n])
+            out[:n] += scratch[:n]
+            self.position[i] = start + n
+            if start + n >= len(sample):
+                self.samples[i] = None
+                self.count -= 1
+
+
+class NoteCache:
+    """
+    LRU cache of single rendered string notes (before the body), shared by every session.
+
+    Keys are (engine, sustain, stiffness, config, dtype, frequency, velocity layer): the first
+    five are a session's parameter set, see params_key. Notes are rendered at the velocity
+    layer's level, the strings are linear in velocity so the exact velocity is a playback gain.
+    Misses are rendered by a background thread, the caller plays them live meanwhile. Entries
+    are evicted oldest-used first once they exceed max_bytes.
+
+    With a SampleBank, notes missing from memory are looked up in the bank before they count as
+    misses, and velocities are quantized to the bank's layers.
+    """
+    def __init__(self, max_bytes:int = 128 << 20, velocity_layers:int = 8, dtype=np.float32, bank = None):
+        self.max_bytes = max_bytes
+        self.bank = bank
+        self.velocity_layers = bank.velocity_layers if bank is not None else velocity_layers
+        self.dtype = dtype
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+
+    def quantize(self, velocity:float) -> float:
+        return max(1, round(velocity * self.velocity_layers)) / self.velocity_layers
+
+    @staticmethod
+    def params_key(engine:type, sustain:float, config, dtype) -> tuple:
+        """Everything besides the note that a render depends on (stiffness lives in config)."""
+        return (engine.__name__, sustain, config.stiffness, repr(config), np.dtype(dtype).name)
+
+    def key(self, params:tuple, freq:float, velocity:float) -> tuple:
+        return params + (round(freq, 6), self.quantize(velocity))
+
+    def get(self, key:tuple) -> np.ndarray:
+        with self._lock:
+            sample = self.entries.get(key)
+            if sample is not None:
+                self.entries.move_to_end(key)
+        if sample is None and self.bank is not None:
+            sample = self.bank.get(key)
+        # Sessions look notes up from many handler threads
+        with self._lock:
+            if sample is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return sample
+
+    def put(self, key:tuple, sample:np.ndarray):
+        sample = sample.astype(self.dtype)
+        with self._lock:
+            self._pending.discard(key)
+            if sample.nbytes > self.max_bytes or key in self.entries:
+                return
+            self.entries[key] = sample
+            self.bytes += sample.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def request(self, key:tuple, render):
+        """Queues render() -> samples for key on the background thread, once per key."""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            if key in self._pending or key in self.entries:
+                return
+            self._pending.add(key)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._render_jobs, daemon=True)
+            self._thread.start()
+        self._jobs.put((key, render))
+
+    def _render_jobs(self):
+        while True:
+            key, render = self._jobs.get()
+            self.put(key, render())
+
+    def retain(self, params_in_use:set):
+        """Drops every entry whose parameter set no session uses any more."""
+        with self._lock:
+            stale = [key for key in self.entries if key[:5] not in params_in_use]
+            for key in stale:
+                self.bytes -= self.entries.pop(key).nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions,
+                    "bank_entries": len(self.bank) if self.bank is not None else 0}
+
+
+def render_note(engine:type, freq:float, velocity:float, sustain_time:float, config, dtype=np.float64,
+                sample_rate:int = 44100, silence_threshold_db:float = -120.0, max_seconds:float = 30.0,
+                block_size:int = 4096) -> np.ndarray:
+    """One pluck on a fresh string, rendered until its loop decays below the threshold."""
+    string = engine(sample_rate=sample_rate, frequency=freq, config=dataclasses.replace(config), dtype=dtype)
+    string.set_frequency(freq, sustain_time=sustain_time)
+    string.excite(velocity)
+    threshold = 10**(silence_threshold_db/20)
+    blocks = []
+    for _ in range(int(max_seconds * sample_rate) // block_size):
+        blocks.append(string.process(block_size))
+        if string.get_peak_level() < threshold:
+            break
+    return np.concatenate(blocks)
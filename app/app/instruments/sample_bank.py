@@ -0,0 +1,112 @@
+"""
+Pre-rendered sample bank.
+
+build_sample_bank renders every fret of the guitar's tuning at a few velocity layers (the same
+string renders NoteCache makes) into one file:
+
+    b"SGBANK01" | uint64 header size | JSON index header, padded | float32 samples
+
+The header holds the sample rate, the number of velocity layers and, per note, its NoteCache
+key with the offset and length of its samples. SampleBank maps the samples with np.memmap:
+opening is instant, processes opening the same file share its pages and the OS page cache
+decides what stays resident.
+"""
+import dataclasses
+import json
+import mmap
+import os
+import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ..physics.core import note_to_midi, midi_to_freq
+from .acoustic_guitar import AcousticGuitar
+from .note_cache import NoteCache, render_note
+
+MAGIC = b"SGBANK01"
+ALIGNMENT = 64 # The samples start on a cache line
+
+
+def _render_job(job) -> np.ndarray:
+    engine, freq, velocity, sustain_time, config, dtype, sample_rate, silence_threshold_db, seed = job
+    # Karplus-Strong excitations are noise, seeded per note so a build is reproducible
+    np.random.seed(seed)
+    return render_note(engine, freq, velocity, sustain_time, config, dtype=dtype, sample_rate=sample_rate,
+                       silence_threshold_db=silence_threshold_db).astype(np.float32)
+
+
+def build_sample_bank(path:str, engine:str = "Digital Waveguide", velocity_layers:int = 4, frets:int = 19,
+                      sustain_time:float = 4.0, stiffness:float = None, dtype=np.float64, sample_rate:int = 44100,
+                      silence_threshold_db:float = -96.0, workers:int = None, seed:int = 0) -> dict:
+    """
+    Renders frets 0..frets on every string of AcousticGuitar's tuning at velocity layers
+    1/n..n/n into path. sustain_time, stiffness and dtype must be the ones sessions play with
+    (a session starts at 4 s and the config's stiffness) for their notes to be found.
+    """
+    guitar = AcousticGuitar(dtype=dtype)
+    string = guitar.build_strings(engine)[0]
+    config = string.config if stiffness is None else dataclasses.replace(string.config, stiffness=stiffness)
+    cache = NoteCache(velocity_layers=velocity_layers)
+    params = cache.params_key(type(string), sustain_time, config, dtype)
+
+    midis = sorted({note_to_midi(note) + fret for note in guitar.tuning_notes for fret in range(frets + 1)})
+    notes = [(midi_to_freq(midi), k / velocity_layers) for midi in midis for k in range(1, velocity_layers + 1)]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(notes))]
+    jobs = [(type(string), freq, velocity, sustain_time, config, dtype, sample_rate, silence_threshold_db, note_seed)
+            for (freq, velocity), note_seed in zip(notes, seeds)]
+
+    # Samples go to a side file as they arrive, the header needs every offset first
+    entries = []
+    offset = 0
+    data_path = path + ".data"
+    with open(data_path, "wb") as data, ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        for (freq, velocity), samples in zip(notes, pool.map(_render_job, jobs)):
+            data.write(samples.tobytes())
+            entries.append({"key": list(cache.key(params, freq, velocity)), "offset": offset, "length": len(samples)})
+            offset += len(samples)
+
+    header = json.dumps({"sample_rate": sample_rate, "velocity_layers": velocity_layers, "entries": entries}).encode()
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+    with open(path, "wb") as bank, open(data_path, "rb") as data:
+        bank.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        shutil.copyfileobj(data, bank)
+    os.remove(data_path)
+    return {"notes": len(midis), "entries": len(entries), "bytes": os.path.getsize(path)}
+
+
+class SampleBank:
+    """A bank file opened read-only, get(key) returns its samples as a view into the mapping."""
+    def __init__(self, path:str):
+        with open(path, "rb") as bank:
+            if bank.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a sample bank")
+            header_size, = struct.unpack("<Q", bank.read(8))
+            header = json.loads(bank.read(header_size))
+        self.path = path
+        self.sample_rate = header["sample_rate"]
+        self.velocity_layers = header["velocity_layers"]
+        self.data_offset = len(MAGIC) + 8 + header_size
+        self.data = np.memmap(path, dtype=np.float32, mode="r", offset=self.data_offset)
+        self.index = {tuple(entry["key"]): (entry["offset"], entry["length"]) for entry in header["entries"]}
+        self.nbytes = self.data.nbytes
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, key:tuple) -> np.ndarray:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        self._prefetch(offset, length)
+        return self.data[offset:offset + length]
+
+    def _prefetch(self, offset:int, length:int):
+        # Called on the control side: start reading the note's pages in now, so the audio
+        # thread does not fault them in itself
+        if not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        # np.memmap maps from the allocation boundary below data_offset
+        start = self.data_offset % mmap.ALLOCATIONGRANULARITY + offset*4
+        aligned = start - start % mmap.PAGESIZE
+        self.data._mmap.madvise(mmap.MADV_WILLNEED, aligned, start + length*4 - aligned)
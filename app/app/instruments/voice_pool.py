@@ -0,0 +1,89 @@
+import numpy as np
+
+STEAL_POLICIES = ("oldest", "quietest", "same-string")
+
+
+class VoicePool:
+    """
+    Allocation of preallocated string voices to notes.
+
+    The voices are ordinary strategy objects made up front. The pool only keeps compact
+    per-voice bookkeeping in fixed arrays (which string a voice plays, when it started), so
+    note_on is a scan over `size` entries and never allocates.
+
+    At most `polyphony` voices sound at once. A note beyond that steals one by policy:
+     - "oldest": the voice started longest ago
+     - "quietest": the voice with the lowest peak level on its loop
+     - "same-string": the voice already sounding on the same string (a real guitar string only
+       plays one note), falling back to the oldest
+    """
+    def __init__(self, voices:list, polyphony:int = None, policy:str = "oldest"):
+        if policy not in STEAL_POLICIES:
+            raise ValueError(f"Unknown steal policy '{policy}', available: {list(STEAL_POLICIES)}")
+        self.size = len(voices)
+        self.policy = policy
+        self.polyphony = self.size if polyphony is None else max(1, min(polyphony, self.size))
+        self.string_of = np.full(self.size, -1, dtype=np.int64)
+        self.started = np.zeros(self.size, dtype=np.int64)
+        self.serial = 0
+        self.stolen = 0
+        self.use_voices(voices)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def use_voices(self, voices:list):
+        """Takes over a new set of voices (same size), all silent."""
+        self.voices = voices
+        self.string_of.fill(-1)
+        self.started.fill(0)
+
+    def active_count(self) -> int:
+        count = 0
+        for voice in self.voices:
+            if voice.awake:
+                count += 1
+        return count
+
+    def _oldest(self) -> int:
+        best, best_started = 0, None
+        for i, voice in enumerate(self.voices):
+            if voice.awake and (best_started is None or self.started[i] < best_started):
+                best, best_started = i, self.started[i]
+        return best
+
+    def _quietest(self) -> int:
+        best, best_level = 0, None
+        for i, voice in enumerate(self.voices):
+            if voice.awake:
+                level = voice.get_peak_level()
+                if best_level is None or level < best_level:
+                    best, best_level = i, level
+        return best
+
+    def _steal(self) -> int:
+        self.stolen += 1
+        if self.policy == "quietest":
+            return self._quietest()
+        return self._oldest()
+
+    def note_on(self, string_index:int) -> int:
+        """Index of the voice that plays the next note on string_index."""
+        index = -1
+        if self.policy == "same-string":
+            for i, voice in enumerate(self.voices):
+                if voice.awake and self.string_of[i] == string_index:
+                    index = i
+                    break
+        if index < 0:
+            if self.active_count() < self.polyphony:
+                for i, voice in enumerate(self.voices):
+                    if not voice.awake:
+                        index = i
+                        break
+            else:
+                index = self._steal()
+        self.serial += 1
+        self.string_of[index] = string_index
+        self.started[index] = self.serial
+        return index
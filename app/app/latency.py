@@ -0,0 +1,118 @@
+import time
+import numpy as np
+
+
+class LatencyGovernor:
+    """
+    Picks the output stream's blocksize from measured render cost.
+
+    Whatever the device blocksize, audio is rendered in fixed sub_block pieces, so the work per
+    sample is the same for every blocksize and only the deadline changes. Smaller sub-blocks pay
+    more per-call overhead, so unless given, sub_block is calibrated as the smallest size whose
+    mean load stays within half the headroom: 64 samples for the compiled kernels on a typical
+    machine, more for the NumPy ones. What then decides whether a blocksize is safe is the worst block:
+    jitter (GC, the scheduler, cache misses) is absolute time, which a short deadline cannot
+    absorb. calibrate() keeps the smallest candidate whose slowest block fits in `headroom` of
+    its deadline.
+
+    review() is the periodic check against the live callback stats (CallbackMonitor.stats()):
+    xruns or a p99 load above back_off call for one size up, and a worst load that would fit the
+    next smaller deadline for one size down. Every move reopens the stream, which is audible, so
+    a move needs `patience` reviews in a row calling for it, and moving down (never urgent) also
+    waits until nothing is sounding.
+    """
+    def __init__(self, render, sample_rate:int = 44100, sub_block:int = None,
+                 candidates=(64, 128, 256, 512, 1024, 2048, 4096), headroom:float = 0.5,
+                 back_off:float = 0.8, min_callbacks:int = 200, patience:int = 3):
+        self.render = render     # render(num_samples, out=None) -> (num_samples, channels)
+        self.fs = sample_rate
+        self.candidates = sorted(candidates)
+        self.fixed_sub_block = sub_block is not None
+        self.sub_block = sub_block if sub_block is not None else self.candidates[0]
+        self.headroom = headroom
+        self.back_off = back_off
+        self.min_callbacks = min_callbacks
+        self.patience = patience
+        self.blocksize = self.candidates[-1]
+        self.measured = {}       # blocksize -> worst calibration load
+        self.changes = 0
+        self._step = 0           # The move the last reviews called for (+1 up, -1 down)
+        self._streak = 0         # How many reviews in a row called for it
+
+    def process_block(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        """Renders num_samples as fixed sub_block pieces, into out when given."""
+        if out is None:
+            return np.concatenate([self.render(min(self.sub_block, num_samples - i))
+                                   for i in range(0, num_samples, self.sub_block)])
+        for i in range(0, num_samples, self.sub_block):
+            stop = min(i + self.sub_block, num_samples)
+            self.render(stop - i, out=out[i:stop])
+        return out
+
+    def _time_blocks(self, blocksize:int, blocks:int, channels:int, seconds:float) -> np.ndarray:
+        # At least 8 blocks, at most `blocks` or `seconds` of audio
+        blocks = max(8, min(blocks, int(seconds*self.fs) // blocksize))
+        out = np.zeros((blocksize, channels))
+        self.process_block(blocksize, out=out)
+        timings = np.empty(blocks)
+        for i in range(blocks):
+            start = time.perf_counter()
+            self.process_block(blocksize, out=out)
+            timings[i] = time.perf_counter() - start
+        return timings * self.fs / blocksize
+
+    def calibrate(self, probe = None, blocks:int = 50, channels:int = 2, seconds:float = 0.25) -> int:
+        """
+        Times probe(num_samples, out=None) (the live render when None), sets sub_block and
+        blocksize and returns the blocksize. The probe should be a worst case that keeps sounding
+        for the whole calibration, e.g. an instrument with every voice plucked on a long sustain.
+        """
+        live = self.render
+        if probe is not None:
+            self.render = probe
+        try:
+            if not self.fixed_sub_block:
+                for size in self.candidates:
+                    self.sub_block = size
+                    if self._time_blocks(size, blocks, channels, seconds).mean() <= self.headroom/2:
+                        break
+
+            self.blocksize = self.candidates[-1]
+            for blocksize in self.candidates:
+                if blocksize < self.sub_block:
+                    continue
+                self.measured[blocksize] = self._time_blocks(blocksize, blocks, channels, seconds).max()
+                if self.measured[blocksize] <= self.headroom:
+                    self.blocksize = blocksize
+                    break
+        finally:
+            self.render = live
+        return self.blocksize
+
+    def latency(self) -> float:
+        """Seconds of audio one device block holds."""
+        return self.blocksize / self.fs
+
+    def review(self, stats:dict, quiet:bool = True) -> int:
+        """
+        The new blocksize when the live stats have called for the same move `patience` reviews
+        in a row, else None. quiet says nothing is sounding, a move down waits for it.
+        """
+        if stats.get("callbacks", 0) < self.min_callbacks:
+            return None
+        index = self.candidates.index(self.blocksize)
+        if (stats["xruns"] or stats["load_p99"] > self.back_off) and index + 1 < len(self.candidates):
+            step = 1
+        elif index > 0 and self.candidates[index - 1] >= self.sub_block and stats["xruns"] == 0 \
+                and stats["load_max"] * self.blocksize / self.candidates[index - 1] <= self.headroom:
+            step = -1
+        else:
+            step = 0
+        self._streak = self._streak + 1 if step and step == self._step else int(step != 0)
+        self._step = step
+        if not step or self._streak < self.patience or (step < 0 and not quiet):
+            return None
+        self.blocksize = self.candidates[index + step]
+        self._step = self._streak = 0
+        self.changes += 1
+        return self.blocksize
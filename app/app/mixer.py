@@ -0,0 +1,297 @@
+"""
+Multi-tenant mixing: one output stream, many independent instruments.
+
+Every client gets an InstrumentSession (its own guitar, scheduler and parameters). The
+MixerEngine renders every live session into the output with the session's gain. Sessions are
+admitted against a CPU budget, which is calibrated by timing a fully excited instrument, so the
+load on the audio thread stays bounded however many users connect.
+
+With a NoteCache, notes every client plays with the same settings (the note buttons) are
+rendered once and then played back as samples, see InstrumentSession._note_event.
+"""
+import dataclasses
+import threading
+import time
+import numpy as np
+from .instruments.acoustic_guitar import AcousticGuitar
+from .instruments.note_cache import render_note
+from .scheduler import EventScheduler
+from .physics import tuning
+from .command_queue import CommandQueue, NOTE_ON, SET_SUSTAIN, SET_STIFFNESS, SET_RESONANCE, SET_STRINGS, SET_GAIN, NOTE_SAMPLE
+
+# Mixer opcodes (control threads -> audio thread)
+ADD_SESSION = 1
+REMOVE_SESSION = 2
+
+
+class InstrumentSession:
+    """One client's instrument. Control methods post events, the audio thread applies them."""
+    def __init__(self, key, model, sample_rate:int = 44100, gain:float = 1.0, note_cache = None,
+                 on_params_changed = None):
+        self.key = key
+        self.model = model
+        self.fs = sample_rate
+        self.gain = gain
+        self.current_freq = 440.0
+        self.current_sustain = 4.0
+        self.current_stiffness = model.strings[0].config.stiffness
+        # The strings the model will have once posted swaps are applied
+        self.current_strings = model.strings
+        self.current_engine = type(model.strings[0])
+        self.note_cache = note_cache
+        self.on_params_changed = on_params_changed # called after sustain/stiffness/engine changes
+        self.scheduler = EventScheduler(model.process_block, self._apply_command, sample_rate=sample_rate)
+        self.last_used = time.monotonic()
+        # False until the client has brought the session in line with its controls
+        self.configured = False
+
+    def _apply_command(self, opcode, arg0, arg1, arg2):
+        """Runs on the audio thread, at the event's sample inside the block."""
+        model = self.model
+        if opcode == NOTE_ON:
+            model.play(arg0, arg1, sustain_time=arg2)
+        elif opcode == NOTE_SAMPLE:
+            sample, gain = arg0
+            model.play_sample(sample, gain, arg1, sustain_time=arg2)
+        elif opcode == SET_SUSTAIN:
+            for string in model.strings:
+                string.set_frequency(string.frequency, sustain_time=arg0, table=arg1)
+        elif opcode == SET_STIFFNESS:
+            # arg2 is the tuning table for the new stiffness, built by set_stiffness
+            for string in model.strings:
+                string.config.stiffness = arg0
+                string.set_frequency(string.frequency, sustain_time=arg1, table=arg2)
+        elif opcode == SET_RESONANCE:
+            model.resonance_enabled = arg0
+        elif opcode == SET_STRINGS:
+            model.use_strings(arg0, arg1)
+        elif opcode == SET_GAIN:
+            self.gain = arg0
+
+    def _post(self, events):
+        self.last_used = time.monotonic()
+        if not self.scheduler.post(events):
+            print(f"Command queue full for session {self.key}, events dropped")
+
+    def _config(self):
+        # The audio thread may not have applied the last stiffness yet, the cache keys on the posted one
+        return dataclasses.replace(self.model.strings[0].config, stiffness=self.current_stiffness)
+
+    def note_params(self) -> tuple:
+        """The parameter part of this session's note cache keys."""
+        return self.note_cache.params_key(self.current_engine, self.current_sustain, self._config(), self.model.dtype)
+
+    def _note_event(self, offset:int, freq:float, vel:float) -> tuple:
+        """
+        A NOTE_ON, or a NOTE_SAMPLE when the note cache holds this note. A miss plays live and
+        has the note rendered in the background for the next time.
+        """
+        cache = self.note_cache
+        if cache is not None:
+            key = cache.key(self.note_params(), freq, vel)
+            layer = key[-1]
+            sample = cache.get(key)
+            if sample is not None:
+                return (offset, NOTE_SAMPLE, (sample, vel / layer), freq, self.current_sustain)
+            engine, sustain, config, model = self.current_engine, self.current_sustain, self._config(), self.model
+            cache.request(key, lambda: render_note(engine, freq, layer, sustain, config, dtype=model.dtype, sample_rate=self.fs,
+                                                   silence_threshold_db=model.silence_threshold_db))
+        return (offset, NOTE_ON, freq, vel, self.current_sustain)
+
+    def _params_changed(self):
+        if self.on_params_changed is not None:
+            self.on_params_changed()
+
+    def pluck(self):
+        self._post([self._note_event(0, self.current_freq, 1.0)])
+
+    def _strum_events(self, note_freqs:list[float], duration:float, direction:str, start:float = 0.0) -> list:
+        sorted_freqs=sorted(note_freqs)
+        if direction == 'up':
+            sorted_freqs.reverse()
+
+        num_strings = len(sorted_freqs)
+        delay_per_string = duration/ max(1, num_strings -1)
+
+        events = []
+        for i, freq in enumerate(sorted_freqs):
+            # Humanize velocity: 0.8 to 1.0
+            vel = np.random.uniform(0.8, 1.0)
+            if i == 0 : vel = 1.0
+
+            offset = self.scheduler.to_samples(start + i*delay_per_string)
+            events.append(self._note_event(offset, freq, vel))
+        return events
+
+    def strum(self, note_freqs: list[float], duration :float=0.05, direction: str = 'down'):
+        """Plays a chord (list of frequencies), one string every duration/(strings-1) seconds."""
+        if note_freqs:
+            self._post(self._strum_events(note_freqs, duration, direction))
+
+    def play_sequence(self, strums:list[tuple]):
+        """
+        Schedules (start_seconds, note_freqs, duration, direction) strums in one go, timed
+        against each other to the sample.
+        """
+        events = []
+        for start, note_freqs, duration, direction in strums:
+            events += self._strum_events(note_freqs, duration, direction, start)
+        self._post(events)
+
+    def set_synthesis_mode(self, mode:str):
+        # Building the strings (and their bank) allocates, so it happens here and the callback only swaps them in
+        strings = self.model.build_strings(mode)
+        self.current_strings = strings
+        self.current_engine = type(strings[0])
+        self._post([(0, SET_STRINGS, strings, self.model.build_string_bank(strings), None)])
+        self._params_changed()
+
+    def set_frequency(self, freq):
+        self.current_freq = freq
+
+    def _tuning_table(self) -> list:
+        # Built here (128 dispersion fits), so retuning the strings on the audio thread is lookups only
+        return tuning.get_tuning_table(self.current_strings[0], self.current_sustain, self.current_stiffness)
+
+    def set_sustain(self, sustain_seconds):
+        ss = 10*(sustain_seconds -0.5)/(0.5) +0.1
+        # Slider events repeat values while dragging, only retune on a real change
+        if ss == self.current_sustain:
+            return
+        self.current_sustain = ss
+        self._post([(0, SET_SUSTAIN, ss, self._tuning_table(), None)])
+        self._params_changed()
+
+    def set_resonance(self, enabled:bool):
+        self._post([(0, SET_RESONANCE, enabled, None, None)])
+
+    def set_stiffness(self, stiffness_val:float):
+        if stiffness_val == self.current_stiffness:
+            return
+        self.current_stiffness = stiffness_val
+        self._post([(0, SET_STIFFNESS, stiffness_val, self.current_sustain, self._tuning_table())])
+        self._params_changed()
+
+    def set_gain(self, gain:float):
+        self._post([(0, SET_GAIN, gain, None, None)])
+
+    def get_effective_frequency(self) -> float:
+        return self.model.get_effective_frequency()
+
+
+class MixerEngine:
+    """
+    Sessions keyed by client. The control side owns the `sessions` dict, the audio thread owns
+    its own list of live sessions and only learns about changes through the inbox, so nothing
+    the callback iterates is ever mutated under it. Handlers run concurrently, so opening and
+    closing sessions (lookup, admission, insert) happens under `_lock`.
+
+    At most `capacity` sessions are admitted: cpu_budget (a fraction of the block deadline) over
+    the calibrated cost of one instance, or max_sessions when given. When full, sessions idle for
+    more than idle_timeout seconds are closed to make room (the client's next event opens a new
+    one, which the client configures again, see InstrumentSession.configured).
+
+    note_cache (a NoteCache) is shared by every session. When a session changes a parameter the
+    notes are rendered with, entries for parameter sets no session uses any more are dropped.
+    """
+    def __init__(self, sample_rate:int = 44100, cpu_budget:float = 0.6, max_sessions:int = None,
+                 idle_timeout:float = 300.0, instrument_factory = None, dtype=np.float64, note_cache = None):
+        self.fs = sample_rate
+        self.dtype = dtype
+        self.cpu_budget = cpu_budget
+        self.idle_timeout = idle_timeout
+        self.instrument_factory = instrument_factory or (lambda: AcousticGuitar(dtype=dtype))
+        self.sessions = {}
+        self.inbox = CommandQueue(256)
+        self._live = []
+        self._scratch = np.zeros((0, 2), dtype=dtype)
+        self.instance_cost = None
+        self.capacity = max_sessions
+        self.rejected = 0
+        self.note_cache = note_cache
+        self._lock = threading.RLock() # close_idle runs inside session()
+
+    def calibrate(self, block_size:int = 512, blocks:int = 40) -> float:
+        """
+        Times an instrument with every string ringing and sizes `capacity` from it (unless
+        max_sessions was given). Returns the cost of one instance as a fraction of the deadline.
+        """
+        model = self.instrument_factory()
+        for freq in model.open_frequencies:
+            model.play(freq, 1.0)
+        out = np.zeros((block_size, 2), dtype=self.dtype)
+        model.process_block(block_size, out=out)
+        start = time.perf_counter()
+        for _ in range(blocks):
+            model.process_block(block_size, out=out)
+            np.add(out, out, out=out) # The mix into the output
+        elapsed = (time.perf_counter() - start) / blocks
+        self.instance_cost = elapsed * self.fs / block_size
+        if self.capacity is None:
+            self.capacity = max(1, int(self.cpu_budget / self.instance_cost))
+        return self.instance_cost
+
+    def session(self, key, create:bool = True) -> InstrumentSession:
+        """The session for key, opened on first use. None when the budget is full."""
+        session = self.sessions.get(key)
+        if session is not None or not create:
+            return session
+        with self._lock:
+            # Another handler of the same client may have opened it meanwhile
+            session = self.sessions.get(key)
+            if session is not None:
+                return session
+            if self.capacity is None:
+                self.calibrate()
+            if len(self.sessions) >= self.capacity:
+                self.close_idle()
+            if len(self.sessions) >= self.capacity:
+                self.rejected += 1
+                return None
+            session = InstrumentSession(key, self.instrument_factory(), sample_rate=self.fs, note_cache=self.note_cache,
+                                        on_params_changed=self._retain_notes)
+            self.sessions[key] = session
+            self.inbox.push(ADD_SESSION, session)
+        return session
+
+    def close_session(self, key):
+        with self._lock:
+            session = self.sessions.pop(key, None)
+            if session is not None:
+                self.inbox.push(REMOVE_SESSION, session)
+
+    def close_idle(self, idle_timeout:float = None) -> int:
+        """Closes sessions that posted nothing for idle_timeout seconds."""
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        cutoff = time.monotonic() - idle_timeout
+        with self._lock:
+            idle = [key for key, s in self.sessions.items() if s.last_used < cutoff]
+            for key in idle:
+                self.close_session(key)
+        return len(idle)
+
+    def _retain_notes(self):
+        if self.note_cache is not None:
+            self.note_cache.retain({s.note_params() for s in list(self.sessions.values())})
+
+    def _receive(self, opcode, session, _, __):
+        if opcode == ADD_SESSION:
+            self._live.append(session)
+        elif opcode == REMOVE_SESSION:
+            self._live.remove(session)
+
+    def process_block(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        """Sum of every live session times its gain, (num_samples, 2), into out when given."""
+        self.inbox.drain(self._receive)
+        if out is None:
+            out = np.zeros((num_samples, 2), dtype=self.dtype)
+        else:
+            out[:] = 0.0
+        if len(self._scratch) < num_samples:
+            self._scratch = np.zeros((num_samples, 2), dtype=self.dtype)
+        scratch = self._scratch[:num_samples]
+        for session in self._live:
+            session.scheduler.process_block(num_samples, out=scratch)
+            np.multiply(scratch, session.gain, out=scratch)
+            np.add(out, scratch, out=out)
+        return out
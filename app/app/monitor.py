@@ -0,0 +1,104 @@
+import logging
+import threading
+import numpy as np
+from .command_queue import CommandQueue
+
+logger = logging.getLogger(__name__)
+
+# Log message opcodes (audio thread -> logger thread)
+LOG_UNDERFLOW = 1
+LOG_OVERFLOW = 2
+LOG_DEADLINE = 3
+
+
+class CallbackMonitor:
+    """
+    Per-callback render time against the block deadline.
+
+    The audio thread only writes into preallocated arrays and counters (record) and posts log
+    messages to a CommandQueue it is the only producer of (push_unlocked), a daemon thread drains that queue into `logging`, so nothing
+    on the callback path prints or blocks. Stats and the histogram are computed on demand
+    from the rolling window by whoever asks.
+    """
+    def __init__(self, sample_rate:int = 44100, window:int = 2048, histogram_max:float = 2.0, histogram_bins:int = 40):
+        self.sample_rate = sample_rate
+        self.window = window
+        self.load = np.zeros(window)     # render time / deadline, per callback
+        self.histogram_edges = np.linspace(0.0, histogram_max, histogram_bins + 1)
+        self.log_queue = CommandQueue(256)
+        self._logger_thread = None
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self):
+        self.callbacks = 0
+        self.underflows = 0
+        self.overflows = 0
+        self.deadline_misses = 0
+        self.load[:] = 0.0
+
+    def record(self, frames:int, elapsed:float, status=None):
+        """Called from the audio callback once the block is rendered."""
+        load = elapsed * self.sample_rate / frames
+        self.load[self.callbacks % self.window] = load
+        self.callbacks += 1
+        if load > 1.0:
+            self.deadline_misses += 1
+            self.log_queue.push_unlocked(LOG_DEADLINE, self.callbacks, load)
+        if status:
+            if status.output_underflow:
+                self.underflows += 1
+                self.log_queue.push_unlocked(LOG_UNDERFLOW, self.callbacks, load)
+            if status.output_overflow:
+                self.overflows += 1
+                self.log_queue.push_unlocked(LOG_OVERFLOW, self.callbacks, load)
+
+    @property
+    def xruns(self) -> int:
+        return self.underflows + self.overflows
+
+    def stats(self) -> dict:
+        count = min(self.callbacks, self.window)
+        load = self.load[:count]
+        if count:
+            p50, p90, p99 = np.percentile(load, [50, 90, 99])
+            mean, peak = load.mean(), load.max()
+        else:
+            p50 = p90 = p99 = mean = peak = 0.0
+        histogram, _ = np.histogram(np.minimum(load, self.histogram_edges[-1]), bins=self.histogram_edges)
+        return {
+            "callbacks": self.callbacks,
+            "underflows": self.underflows,
+            "overflows": self.overflows,
+            "xruns": self.xruns,
+            "deadline_misses": self.deadline_misses,
+            # Load is the fraction of the block duration spent rendering (1.0 = deadline)
+            "load_mean": float(mean),
+            "load_p50": float(p50),
+            "load_p90": float(p90),
+            "load_p99": float(p99),
+            "load_max": float(peak),
+            "histogram_edges": self.histogram_edges.tolist(),
+            "histogram": histogram.tolist(),
+        }
+
+    def _log(self, opcode, callback, load, _):
+        if opcode == LOG_UNDERFLOW:
+            logger.warning("Output underflow at callback %d (load %.0f%%)", callback, load*100)
+        elif opcode == LOG_OVERFLOW:
+            logger.warning("Output overflow at callback %d (load %.0f%%)", callback, load*100)
+        elif opcode == LOG_DEADLINE:
+            logger.warning("Callback %d missed its deadline (load %.0f%%)", callback, load*100)
+
+    def _drain_logs(self):
+        while not self._stop.wait(0.25):
+            self.log_queue.drain(self._log)
+        self.log_queue.drain(self._log)
+
+    def start(self):
+        if self._logger_thread is None:
+            self._logger_thread = threading.Thread(target=self._drain_logs, daemon=True)
+            self._logger_thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,98 @@
+import time
+import wave
+import numpy as np
+from .instruments.acoustic_guitar import AcousticGuitar
+from .scheduler import EventScheduler
+from .command_queue import NOTE_ON
+from .physics.core import note_to_freq
+
+
+def note_events(notes, sample_rate:int = 44100) -> list:
+    """
+    Converts (start_seconds, note_or_freq, velocity, sustain_time) tuples into scheduler events
+    with absolute sample times.
+    """
+    events = []
+    for start, note, velocity, sustain_time in notes:
+        freq = note_to_freq(note) if isinstance(note, str) else float(note)
+        events.append((int(round(start*sample_rate)), NOTE_ON, freq, velocity, sustain_time))
+    return events
+
+
+class WavStreamWriter:
+    """16-bit PCM WAV written chunk by chunk, the file header is patched on close."""
+    def __init__(self, path:str, sample_rate:int = 44100, channels:int = 2):
+        self.channels = channels
+        self.file = wave.open(str(path), "wb")
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(sample_rate)
+        self.frames_written = 0
+
+    def write(self, block:np.ndarray):
+        pcm = np.clip(block, -1.0, 1.0) * 32767.0
+        self.file.writeframes(pcm.astype("<i2").tobytes())
+        self.frames_written += len(block)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OfflineRenderer:
+    """
+    Drives AcousticGuitar.process_block as fast as the CPU allows and streams fixed-size chunks
+    to a WAV file, so memory stays flat no matter how long the render is.
+    """
+    def __init__(self, guitar:AcousticGuitar = None, sample_rate:int = 44100, chunk_size:int = 4096):
+        self.guitar = guitar if guitar else AcousticGuitar()
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.scheduler = EventScheduler(self.guitar.process_block, self._apply, sample_rate=sample_rate)
+
+    def _apply(self, opcode, freq, velocity, sustain_time):
+        if opcode == NOTE_ON:
+            self.guitar.play(freq, velocity=velocity, sustain_time=sustain_time)
+
+    def render(self, events, path:str, duration:float = None, max_tail:float = 10.0) -> dict:
+        """
+        Renders scheduler events (absolute sample times) into path.
+        duration=None renders until the last event has rung out (the instrument goes silent),
+        capped at max_tail seconds after it.
+        """
+        events = sorted(events, key=lambda e: e[0])
+        start_clock = self.scheduler.clock
+        self.scheduler.post(events, at=start_clock)
+        last_event = events[-1][0] if events else 0
+
+        if duration is not None:
+            total = int(round(duration*self.sample_rate))
+        else:
+            total = last_event + int(round(max_tail*self.sample_rate))
+
+        rendered = 0
+        start = time.perf_counter()
+        with WavStreamWriter(path, self.sample_rate) as writer:
+            while rendered < total:
+                block = self.scheduler.process_block(min(self.chunk_size, total - rendered))
+                writer.write(block)
+                rendered += len(block)
+                if duration is None and rendered > last_event and not block.any():
+                    break
+        elapsed = time.perf_counter() - start
+
+        audio_seconds = rendered / self.sample_rate
+        stats = {
+            "path": str(path),
+            "audio_seconds": audio_seconds,
+            "wall_seconds": elapsed,
+            "realtime_factor": audio_seconds / elapsed if elapsed > 0 else float("inf"),
+        }
+        print(f"Rendered {audio_seconds:.1f}s of audio in {elapsed:.2f}s "
+              f"({stats['realtime_factor']:.1f}x realtime) -> {path}")
+        return stats
@@ -0,0 +1,209 @@
+"""
+Process-pool offline rendering.
+
+Two ways to split a job:
+ - by take: every take (an event list) is rendered start to finish by one worker into its own file
+ - by voice: every string renders its own notes in a worker, the parent sums the strings in a
+   fixed order and runs the body over the mix. Workers build only their strings and write
+   fixed-size segments into a shared-memory double buffer, so nothing is pickled per segment
+   and memory stays flat however long the sequence is
+
+Every job seeds the global NumPy RNG (excitation noise, body noise) from a SeedSequence keyed by
+the job index (or string), never by the worker, so the output is bit-identical for any number
+of workers above one.
+"""
+import dataclasses
+import os
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .instruments.acoustic_guitar import AcousticGuitar
+from .scheduler import EventScheduler
+from .offline import OfflineRenderer, WavStreamWriter
+from .command_queue import NOTE_ON
+
+
+def job_seeds(seed:int, count:int) -> list[int]:
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(count)]
+
+def _make_guitar(strategy:str) -> AcousticGuitar:
+    guitar = AcousticGuitar()
+    if strategy:
+        guitar.set_synthesis_strategy(strategy)
+    return guitar
+
+def _render_take(job) -> dict:
+    events, path, seed, strategy, duration, chunk_size = job
+    np.random.seed(seed)
+    renderer = OfflineRenderer(_make_guitar(strategy), chunk_size=chunk_size)
+    return renderer.render(events, path, duration=duration)
+
+def _string_renderer(string, events:list, sample_rate:int, silence_threshold:float) -> EventScheduler:
+    """One string playing its own notes, put to sleep once it decays as AcousticGuitar does."""
+    def play(opcode, freq, velocity, sustain_time):
+        if opcode == NOTE_ON:
+            string.set_frequency(freq, sustain_time=sustain_time)
+            string.excite(velocity)
+
+    def render(num_samples, out=None):
+        if not string.awake:
+            out[:] = 0.0
+            return out
+        string.process(num_samples, out=out)
+        if string.get_peak_level() < silence_threshold:
+            string.sleep()
+        return out
+
+    scheduler = EventScheduler(render, play, sample_rate=sample_rate)
+    scheduler.post(events, at=0)
+    return scheduler
+
+def _render_voices(voices:list, engine:type, config, dtype, silence_threshold:float, total:int, sample_rate:int,
+                   chunk_size:int, segment:int, buffer_name:str, num_strings:int, free, ready):
+    """
+    Worker: builds only its own strings, (index, open frequency, events, seed) each, and renders
+    them one segment at a time into rows of the shared (2, num_strings, segment) buffer, slot
+    k % 2 for segment k. `free` counts slots the parent has mixed, `ready` the segments written.
+    Every string is built right after seeding from its own seed, so the result does not depend
+    on which strings share a worker.
+    """
+    shm = shared_memory.SharedMemory(name=buffer_name)
+    buffer = np.ndarray((2, num_strings, segment), dtype=np.float64, buffer=shm.buf)
+    rows = []
+    schedulers = []
+    for index, freq, events, seed in voices:
+        np.random.seed(seed)
+        string = engine(sample_rate=sample_rate, frequency=freq, config=dataclasses.replace(config), dtype=dtype)
+        rows.append(index)
+        schedulers.append(_string_renderer(string, events, sample_rate, silence_threshold))
+    out = np.empty(chunk_size, dtype=dtype)
+    for k, start in enumerate(range(0, total, segment)):
+        stop = min(start + segment, total)
+        free.acquire()
+        for row, scheduler in zip(rows, schedulers):
+            for block in range(start, stop, chunk_size):
+                n = min(block + chunk_size, stop) - block
+                buffer[k % 2, row, block - start:block - start + n] = scheduler.process_block(n, out=out[:n])
+        ready.release()
+    shm.close()
+
+def _wait_segment(ready, process):
+    while not ready.acquire(timeout=1.0):
+        if not process.is_alive():
+            raise RuntimeError(f"Voice worker {process.name} exited early")
+
+
+class ParallelRenderer:
+    def __init__(self, workers:int = None, strategy:str = None, seed:int = 0,
+                 sample_rate:int = 44100, chunk_size:int = 4096):
+        self.workers = workers or os.cpu_count()
+        self.strategy = strategy
+        self.seed = seed
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+
+    def render_takes(self, takes:list, paths:list, duration:float = None) -> list[dict]:
+        """Renders each event list in takes to the matching path, one take per job."""
+        seeds = job_seeds(self.seed, len(takes))
+        jobs = [(events, path, seed, self.strategy, duration, self.chunk_size)
+                for events, path, seed in zip(takes, paths, seeds)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(_render_take, jobs))
+
+    def render_voices(self, events:list, path:str, duration:float = None, max_tail:float = 10.0,
+                      segment_chunks:int = 16) -> dict:
+        """
+        Renders one sequence with the strings split across workers (render_voices_split). With
+        one worker or one CPU splitting only adds overhead, the sequence is then rendered by a
+        plain OfflineRenderer (seeded with seed). benchmark_render.py measures the speedup.
+        """
+        if self.workers <= 1 or os.cpu_count() == 1:
+            np.random.seed(self.seed)
+            renderer = OfflineRenderer(_make_guitar(self.strategy), self.sample_rate, self.chunk_size)
+            return renderer.render(events, path, duration=duration, max_tail=max_tail)
+        return self.render_voices_split(events, path, duration, max_tail, segment_chunks)
+
+    def render_voices_split(self, events:list, path:str, duration:float = None, max_tail:float = 10.0,
+                            segment_chunks:int = 16) -> dict:
+        """
+        Renders one sequence with the strings split across workers, mixed back in string order.
+        Workers render segment_chunks chunks at a time into a shared double buffer, so they stay
+        at most two segments ahead of the writer. The body runs over the mix in this process.
+        """
+        guitar = _make_guitar(self.strategy)
+        num_strings = len(guitar.strings)
+        string = guitar.strings[0]
+        last_event = max((e[0] for e in events), default=0)
+        if duration is not None:
+            total = int(round(duration*self.sample_rate))
+        else:
+            total = last_event + int(round(max_tail*self.sample_rate))
+
+        per_string = [[] for _ in range(num_strings)]
+        for event in events:
+            per_string[guitar.select_string(event[2])].append(event)
+        # One extra seed for the body noise in the parent
+        seeds = job_seeds(self.seed, num_strings + 1)
+        workers = min(self.workers, num_strings)
+        owned = [list(range(w, num_strings, workers)) for w in range(workers)]
+        segment = self.chunk_size * segment_chunks
+        silence_threshold = 10**(guitar.silence_threshold_db/20)
+
+        start = time.perf_counter()
+        shm = shared_memory.SharedMemory(create=True, size=2*num_strings*segment*8)
+        buffer = np.ndarray((2, num_strings, segment), dtype=np.float64, buffer=shm.buf)
+        free = [mp.Semaphore(2) for _ in range(workers)]
+        ready = [mp.Semaphore(0) for _ in range(workers)]
+        processes = [mp.Process(target=_render_voices, daemon=True,
+                                args=([(i, guitar.open_frequencies[i], per_string[i], seeds[i]) for i in owned[w]],
+                                      type(string), string.config, guitar.dtype, silence_threshold, total,
+                                      self.sample_rate, self.chunk_size, segment, shm.name, num_strings,
+                                      free[w], ready[w]))
+                     for w in range(workers)]
+        for process in processes:
+            process.start()
+
+        # The body's noise table is drawn when it is built, so the guitar is rebuilt after seeding
+        np.random.seed(seeds[-1])
+        guitar = _make_guitar(self.strategy)
+        rendered = 0
+        mix = np.empty(segment)
+        try:
+            with WavStreamWriter(path, self.sample_rate) as writer:
+                for k, segment_start in enumerate(range(0, total, segment)):
+                    n = min(segment, total - segment_start)
+                    for w in range(workers):
+                        _wait_segment(ready[w], processes[w])
+                    mix[:n] = buffer[k % 2, 0, :n]
+                    for row in buffer[k % 2, 1:]:
+                        mix[:n] += row[:n]
+                    for w in range(workers):
+                        free[w].release()
+                    silent = False
+                    for chunk in range(0, n, self.chunk_size):
+                        block = guitar.apply_body(mix[chunk:min(chunk + self.chunk_size, n)])
+                        writer.write(block)
+                        rendered += len(block)
+                        if duration is None and rendered > last_event and not block.any():
+                            silent = True
+                            break
+                    if silent:
+                        break
+        finally:
+            # Workers stopped early (silence) are blocked waiting for a free slot
+            for process in processes:
+                process.terminate()
+                process.join()
+            buffer = None
+            shm.close()
+            shm.unlink()
+        elapsed = time.perf_counter() - start
+
+        audio_seconds = rendered / self.sample_rate
+        stats = {"path": str(path), "audio_seconds": audio_seconds, "wall_seconds": elapsed,
+                 "realtime_factor": audio_seconds / elapsed if elapsed > 0 else float("inf")}
+        print(f"Rendered {audio_seconds:.1f}s of audio in {elapsed:.2f}s "
+              f"({stats['realtime_factor']:.1f}x realtime, {workers} workers) -> {path}")
+        return stats
@@ -1,5 +1,6 @@
 from .core import IPhysicsStrategy
 from .karplus_strong import KarplusStrongAlgorithm
 from .dwg import DigitalWaveguideStrategy
-from .body import GuitarBody
+from .body import GuitarBody, StereoGuitarBody, ConvolutionBody
 from .stiffness import StiffnessDispersion
+from .kernels import get_backend, set_backend, register_backend, available_backends
@@ -1,45 +1,263 @@
+from math import gcd
 import numpy as np
-from scipy.signal import lfilter, butter, lfilter_zi
+from scipy.io import wavfile
+from scipy.signal import butter, sosfilt_zi, resample_poly
+from . import kernels
 
 class GuitarBody():
-    def __init__(self, sample_rate : int = 44100, resonance_freq:float =100.0):
+    def __init__(self, sample_rate : int = 44100, resonance_freq:float =100.0, silence_threshold_db:float = -120.0, silence_hold:float = 0.5, dtype=np.float64):
         self.sample_rate = sample_rate
+        self.dtype = dtype
         cutoff_hz = 3000
         nyquist = 0.5 * sample_rate
         normal_cutoff = cutoff_hz/nyquist
         
 
-        # Design the Butterworth Filter coefficients (b,a)
-        # b = feedforward coeffs, a = feedback coeffs
-        self.b, self.a = butter(N=2, Wn=normal_cutoff, btype= 'low', analog=False)
+        # Design the Butterworth Filter coefficients as second-order sections
+        # (the narrow Helmholtz bandpass is unstable as a single float32 polynomial)
+        self.sos = butter(N=2, Wn=normal_cutoff, btype= 'low', analog=False, output='sos').astype(dtype)
 
-        # Initialize the State Vector (zi) to zeros
+        # Initialize the State Vector (zi), one row per section
         # This memory vector keeps the filter continuous across blocks
-        self.zi = lfilter_zi(self.b, self.a)
+        self.zi = sosfilt_zi(self.sos).astype(dtype)
         
         #Helmholtz filter
-        self.bp_b, self.bp_a = butter(N=2, Wn = [(resonance_freq-20)/nyquist, (resonance_freq+20)/nyquist],btype = 'bandpass', analog =False)
-        self.bp_zi = lfilter_zi(self.bp_b, self.bp_a)
+        self.bp_sos = butter(N=2, Wn = [(resonance_freq-20)/nyquist, (resonance_freq+20)/nyquist],btype = 'bandpass', analog =False, output='sos').astype(dtype)
+        self.bp_zi = sosfilt_zi(self.bp_sos).astype(dtype)
 
         #Simulating white noise
         self.noise_gain = 0.0002
-        
+        # Own generator filling a reused buffer
+        self.rng = np.random.default_rng(kernels.global_seed())
+        self.noise = np.zeros(0, dtype=dtype)
+
+        # Idle gate: after silence_hold seconds of input below the threshold the filters
+        # have rung out, so the body (and its noise floor) stops computing
+        self.silence_threshold = 10**(silence_threshold_db/20)
+        self.silence_hold = int(silence_hold*sample_rate)
+        self.silent_samples = 0
+        self.asleep = False
+
+    def reset(self):
+        self.zi.fill(0.0)
+        self.bp_zi.fill(0.0)
+
+
+    def process(self, signal: np.ndarray, out:np.ndarray = None) -> np.ndarray:
+        """Filters signal into out (allocated when None) and returns it."""
+        num_samples = len(signal)
+        if out is None:
+            out = np.empty(num_samples, dtype=self.dtype)
+        if num_samples and kernels.peak(signal) < self.silence_threshold:
+            self.silent_samples += num_samples
+        else:
+            self.silent_samples = 0
+            self.asleep = False
+        if self.silent_samples >= self.silence_hold:
+            if not self.asleep:
+                self.reset()
+                self.asleep = True
+            out[:] = 0.0
+            return out
+
+        if len(self.noise) < num_samples:
+            self.noise = np.empty(num_samples, dtype=self.dtype)
+        noise = self.noise[:num_samples]
+        self.rng.standard_normal(dtype=self.dtype, out=noise)
+        return kernels.get_backend().body(self, signal, noise, out)
+
+
+SATURATIONS = {"tanh": 0, "soft": 1}
+
+class StereoGuitarBody():
+    """
+    Both body channels in one processor. The wood lowpass is the same on every channel, so it
+    runs once on the mono input, and only the Helmholtz bandpasses (one per channel, stacked
+    as a (channels, sections, 6) array with a matching state) differ. The noise floor loops
+    over a table drawn once, and saturation is tanh or a cheaper rational soft clip.
+    """
+    def __init__(self, sample_rate:int = 44100, resonance_freqs=(95.0, 105.0), silence_threshold_db:float = -120.0,
+                 silence_hold:float = 0.5, saturation:str = "tanh", noise_seconds:float = 3.0, seed:int = None, dtype=np.float64):
+        if saturation not in SATURATIONS:
+            raise ValueError(f"Unknown saturation '{saturation}', available: {list(SATURATIONS)}")
+        self.sample_rate = sample_rate
+        self.dtype = dtype
+        self.channels = len(resonance_freqs)
+        self.saturation = saturation
+        nyquist = 0.5 * sample_rate
+
+        # Wood damping, shared by all channels
+        self.sos = butter(N=2, Wn=3000/nyquist, btype='low', analog=False, output='sos').astype(dtype)
+        self.zi = sosfilt_zi(self.sos).astype(dtype)
+
+        #Helmholtz filters, one cascade per channel
+        self.bp_sos = np.stack([butter(N=2, Wn=[(f-20)/nyquist, (f+20)/nyquist], btype='bandpass', analog=False, output='sos')
+                                for f in resonance_freqs]).astype(dtype)
+        self.bp_zi = np.stack([sosfilt_zi(sos) for sos in self.bp_sos.astype(np.float64)]).astype(dtype)
+
+        # Looping white noise table, independent per channel
+        if seed is None:
+            seed = kernels.global_seed()
+        self._unit_noise = np.random.default_rng(seed).standard_normal((self.channels, int(noise_seconds*sample_rate)))
+        self.noise_pos = 0
+        self.set_noise_gain(0.0002)
+
+        # Idle gate, as in GuitarBody
+        self.silence_threshold = 10**(silence_threshold_db/20)
+        self.silence_hold = int(silence_hold*sample_rate)
+        self.silent_samples = 0
+        self.asleep = False
+
+    def set_noise_gain(self, gain:float):
+        self.noise_gain = gain
+        self.noise = (self._unit_noise * gain).astype(self.dtype)
+
+    def noise_block(self, num_samples:int) -> np.ndarray:
+        """The next (channels, num_samples) stretch of the noise table, a view unless it wraps."""
+        start = self.noise_pos
+        length = self.noise.shape[1]
+        self.noise_pos = (start + num_samples) % length
+        if start + num_samples <= length:
+            return self.noise[:, start:start + num_samples]
+        return np.take(self.noise, np.arange(start, start + num_samples), axis=1, mode='wrap')
+
+    def reset(self):
+        self.zi.fill(0.0)
+        self.bp_zi.fill(0.0)
+
+    def process(self, signal:np.ndarray, out:np.ndarray = None, gain:float = 1.0) -> np.ndarray:
+        """Mono signal -> (num_samples, channels) into out (allocated when None, any float dtype), scaled by gain."""
+        num_samples = len(signal)
+        if out is None:
+            out = np.empty((num_samples, self.channels), dtype=self.dtype)
+        if num_samples and kernels.peak(signal) < self.silence_threshold:
+            self.silent_samples += num_samples
+        else:
+            self.silent_samples = 0
+            self.asleep = False
+        if self.silent_samples >= self.silence_hold:
+            if not self.asleep:
+                self.reset()
+                self.asleep = True
+            out[:] = 0.0
+            return out
+        return kernels.get_backend().stereo_body(self, signal, out, gain)
+
+
+def load_impulse_response(path:str, sample_rate:int = 44100) -> np.ndarray:
+    """Reads a body IR WAV as a float (channels, length) array at sample_rate."""
+    sr, data = wavfile.read(path)
+    if data.dtype == np.int16:
+        data = data / 32768.0
+    elif data.dtype == np.int32:
+        data = data / 2147483648.0
+    elif data.dtype == np.uint8:
+        data = (data - 128.0) / 128.0
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, None]
+    if sr != sample_rate:
+        g = gcd(sample_rate, sr)
+        data = resample_poly(data, sample_rate // g, sr // g, axis=0)
+    return data.T
+
+
+class ConvolutionBody():
+    """
+    Body from a measured impulse response, by uniformly partitioned overlap-add convolution.
+
+    The IR is cut into partitions of block_size samples whose 2*block_size spectra are kept.
+    Every block_size input samples cost one forward FFT (pushed into a frequency-domain delay
+    line), a multiply-accumulate of the delay line against the partition spectra, and one inverse
+    FFT per channel. Input is buffered to whole partitions, so the latency is block_size samples
+    whatever the caller's block sizes are. A mono IR feeds both channels.
+    """
+    def __init__(self, impulse_response, sample_rate:int = 44100, block_size:int = 512, channels:int = 2,
+                 normalize:bool = True, silence_threshold_db:float = -120.0, silence_hold:float = 0.5, dtype=np.float64):
+        self.sample_rate = sample_rate
+        self.dtype = dtype
+        self.block_size = block_size
+        self.channels = channels
+        if isinstance(impulse_response, str):
+            impulse_response = load_impulse_response(impulse_response, sample_rate)
+        ir = np.atleast_2d(np.asarray(impulse_response, dtype=np.float64))
+        if ir.shape[0] == 1:
+            ir = np.repeat(ir, channels, axis=0)
+        ir = ir[:channels]
+
+        # Partition spectra, bin-major (block_size + 1, channels, partitions) so the accumulation
+        # is one batched (channels, P) @ (P, 1) product per bin
+        self.num_partitions = max(1, -(-ir.shape[1] // block_size))
+        padded = np.zeros((channels, self.num_partitions * block_size))
+        padded[:, :ir.shape[1]] = ir
+        spectra = np.fft.rfft(padded.reshape(channels, self.num_partitions, block_size), 2*block_size)
+        if normalize:
+            # Peak of the magnitude response at 1, like the filter body's lowpass passband
+            spectra /= np.abs(np.fft.rfft(ir, 2*block_size*self.num_partitions)).max() + 1e-30
+        complex_dtype = np.result_type(dtype, np.complex64)
+        self.spectra = np.ascontiguousarray(spectra.transpose(2, 0, 1), dtype=complex_dtype)
+
+        # Input spectra are written twice, `num_partitions` columns apart, so the newest P of
+        # them are always the slice delay_line[:, head:head + P], newest first
+        self.delay_line = np.zeros((block_size + 1, 2*self.num_partitions), dtype=complex_dtype)
+        self.accumulated = np.zeros((block_size + 1, channels, 1), dtype=complex_dtype)
+        self.head = 0
+        self.input = np.zeros(block_size, dtype=dtype)
+        self.output = np.zeros((channels, block_size), dtype=dtype)
+        self.overlap = np.zeros((channels, block_size), dtype=dtype)
+        self.fill = 0
 
+        # Idle gate, held for the IR's length on top so the tail rings out before sleeping
+        self.silence_threshold = 10**(silence_threshold_db/20)
+        self.silence_hold = int(silence_hold*sample_rate) + ir.shape[1]
+        self.silent_samples = 0
+        self.asleep = False
 
-    def process(self, signal: np.ndarray) -> np.ndarray:
-        # Apply the filter with state preservaction
-        # input: signal + current_state (self.zi)
-        # output: filtered_signal + new_state (self.zf)
+    def reset(self):
+        self.delay_line.fill(0.0)
+        self.input.fill(0.0)
+        self.output.fill(0.0)
+        self.overlap.fill(0.0)
+        self.fill = 0
 
-        #Apply Wood Damping (low Pass) 
-        filtered_signal, self.zf = lfilter(self.b, self.a, signal, zi=self.zi)
-        self.zi = self.zf
-        #Apply Helmholtz Resonance (Bandpass)
-        boom, self.bp_zf = lfilter(self.bp_b, self.bp_a, signal, zi=self.bp_zi)
-        self.bp_zi = self.bp_zf
+    def _convolve_block(self):
+        B = self.block_size
+        P = self.num_partitions
+        self.head = (self.head - 1) % P
+        spectrum = np.fft.rfft(self.input, 2*B)
+        self.delay_line[:, self.head] = spectrum
+        self.delay_line[:, self.head + P] = spectrum
+        np.matmul(self.spectra, self.delay_line[:, self.head:self.head + P, None], out=self.accumulated)
+        result = np.fft.irfft(self.accumulated[:, :, 0].T, 2*B)
+        np.add(result[:, :B], self.overlap, out=self.output)
+        self.overlap[:] = result[:, B:]
 
-        raw_output = filtered_signal + (boom*1.5)
+    def process(self, signal:np.ndarray, out:np.ndarray = None, gain:float = 1.0) -> np.ndarray:
+        """Mono signal -> (num_samples, channels) into out (allocated when None), delayed by block_size."""
+        num_samples = len(signal)
+        if out is None:
+            out = np.empty((num_samples, self.channels), dtype=self.dtype)
+        if num_samples and kernels.peak(signal) < self.silence_threshold:
+            self.silent_samples += num_samples
+        else:
+            self.silent_samples = 0
+            self.asleep = False
+        if self.silent_samples >= self.silence_hold:
+            if not self.asleep:
+                self.reset()
+                self.asleep = True
+            out[:] = 0.0
+            return out
 
-        noise = np.random.normal(0, self.noise_gain, size=signal.shape)
-        raw_output += noise
-        return np.tanh(raw_output)
+        B = self.block_size
+        done = 0
+        while done < num_samples:
+            count = min(B - self.fill, num_samples - done)
+            self.input[self.fill:self.fill + count] = signal[done:done + count]
+            np.multiply(self.output[:, self.fill:self.fill + count].T, gain, out=out[done:done + count])
+            self.fill += count
+            done += count
+            if self.fill == B:
+                self._convolve_block()
+                self.fill = 0
+        return out
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 import numpy as np
 from dataclasses import dataclass, field
+from functools import lru_cache
 
 @dataclass
 class InstrumentConfig:
@@ -20,16 +21,23 @@ class IPhysicsStrategy(ABC):
         pass
 
     @abstractmethod
-    def process(self, num_samples:int) -> np.ndarray:
+    def process(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        """Renders num_samples, into out when given."""
         pass
 
-def note_to_freq(note:str)-> float:
+@lru_cache(maxsize=None)
+def note_to_midi(note:str) -> int:
     notes: dict[str, int] = {"A":9, "A#":10, "B":11, "C":0,"C#":1, "D":2, "D#":3,"E":4, "F":5, "F#":6, "G":7, "G#":8}
     octave = int(note[-1])
     octave_multiplier: int = 12 * (octave+1)
-    n: int = notes[note[:-1]]+octave_multiplier
-    frequency = 440.0 * (2.0 ** ((n - 69) / 12.0))
-    return frequency
+    return notes[note[:-1]]+octave_multiplier
+
+def midi_to_freq(n:int) -> float:
+    return 440.0 * (2.0 ** ((n - 69) / 12.0))
+
+@lru_cache(maxsize=None)
+def note_to_freq(note:str)-> float:
+    return midi_to_freq(note_to_midi(note))
 
 class Instrument:
     def __init__(self, name:str, strategy: IPhysicsStrategy):
@@ -40,6 +48,6 @@ class Instrument:
         self.strategy.set_frequency(frequency)
         self.strategy.excite(velocity)
 
-    def process_block (self, num_samples):
+    def process_block (self, num_samples, out=None):
         #Delegate the math to the strategy
-        return self.strategy.process(num_samples)
+        return self.strategy.process(num_samples, out=out)
@@ -1,11 +1,37 @@
-from alembic.command import current
 from typing import override
 from .core import IPhysicsStrategy, InstrumentConfig
-from .utils import FractionalDelay, LowPassFilter, StiffnessDispersion
+from .utils import FractionalDelay, LowPassFilter, StiffnessDispersion, _fit_stiffness
+from . import kernels, tuning
 import collections
+from functools import lru_cache
 import numpy as np
 
 
+@lru_cache(maxsize=512)
+def _pluck_shape(buffer_size:int, pluck_pos:int, width:int) -> np.ndarray:
+    """
+    Unit-velocity pluck: a triangle peaking at pluck_pos with the tip rounded over 'width'
+    samples. Cached and shared, so callers must scale it into their own buffer.
+    """
+    i = np.arange(buffer_size)
+
+    # 1. Calculate Ideal Sharp Triangle
+    shape = np.where(i <= pluck_pos,
+                     0.5 * (i / pluck_pos),
+                     0.5 * ((buffer_size - i) / (buffer_size - pluck_pos)))
+
+    # 2. Smooth the tip using a simple polynomial window
+    # Quadratic smoothing: val * (1 - (dist/width)^2 * scaling), makes the sharp point a parabola
+    dist = np.abs(i - pluck_pos)
+    tip = dist < width
+    correction = (dist[tip] / width) ** 2
+    shape[tip] *= 1.0 - 0.2 * (1.0 - correction)
+    return shape
+
+@lru_cache(maxsize=512)
+def _pickup_offsets(buffer_size:int, ratios:tuple) -> np.ndarray:
+    return np.array([int(buffer_size*r) for r in ratios], dtype=np.int64)
+
 #Configurables
 # Alpha for low pass filter
 # Listening at pickup versus listening at bridge (electric versus acoustic apparently)
@@ -17,26 +43,30 @@ import numpy as np
 # Decay factor
 
 class DigitalWaveguideStrategy(IPhysicsStrategy):
-    def __init__(self, sample_rate = 44100, frequency:float = 440.0, config :InstrumentConfig = InstrumentConfig()):
+    def __init__(self, sample_rate = 44100, frequency:float = 440.0, config :InstrumentConfig = InstrumentConfig(), dtype=np.float64):
         self.sample_rate = sample_rate
+        # Sample precision of the rails and filter states (np.float32 halves the memory traffic)
+        self.dtype = dtype
         self.config = config
         self.decay_factor = config.string_damping
 
         self.frequency = 0.0
         self.buffer_size = int(self.sample_rate/(frequency*2))
         self.max_size = 4096
-        self.right_buffer = [0.0] * self.max_size
-        self.left_buffer = [0.0]  * self.max_size
+        self.right_buffer = np.zeros(self.max_size, dtype=dtype)
+        self.left_buffer = np.zeros(self.max_size, dtype=dtype)
 
         self.ptr = 0
+        self.awake = False # False = silent, the instrument skips this string until the next excite
         self.prev_output = 0.0
         self.ap_x_prev = 0.0
         self.ap_y_prev = 0.0
+        self.kernel_state = np.zeros(3, dtype=dtype)
 
         #Initialize our utility objects
         self.fractional_delay = FractionalDelay()
         self.damping_filter = LowPassFilter(alpha=0.2)
-        self.stiffness = StiffnessDispersion(stiffness = config.stiffness)
+        self.stiffness = StiffnessDispersion(stiffness = config.stiffness, dtype=dtype)
 
         self.pickup_locations = {
             "bridge":[0.08],
@@ -48,10 +78,15 @@ class DigitalWaveguideStrategy(IPhysicsStrategy):
         }
 
         self.set_frequency(frequency)
-    @override
-    def set_frequency(self, frequency:float=440.0,sustain_time:float=4.0):
-        self.frequency = frequency
-        self.current_damping = 10**(-3/(frequency*sustain_time))
+    def tuning_key(self, sustain_time:float, stiffness:float = None) -> tuple:
+        """Everything besides the frequency that compute_tuning depends on."""
+        stiffness = self.config.stiffness if stiffness is None else stiffness
+        return (type(self), self.sample_rate, sustain_time, stiffness, self.stiffness.stages)
+
+    def compute_tuning(self, frequency:float, sustain_time:float, stiffness:float = None) -> tuple:
+        """Derives the loop parameters for a frequency without touching the string's state."""
+        stiffness = self.config.stiffness if stiffness is None else stiffness
+        current_damping = 10**(-3/(frequency*sustain_time))
 
         if frequency > 600.0:
             new_alpha = 0.08
@@ -60,22 +95,29 @@ class DigitalWaveguideStrategy(IPhysicsStrategy):
         else:
             ratio = (frequency - 300.0) / 300.0
             new_alpha = 0.2 - (0.12*ratio)
-        self.damping_filter.set_alpha(new_alpha)
          
         ideal_N = (self.sample_rate/frequency)/2.0
-        stiffness_delay = self.stiffness.update_stiffness(self.config.stiffness, ideal_N*0.7-1.0)
+        stiffness_a, stiffness_delay = _fit_stiffness(stiffness, self.stiffness.stages, ideal_N*0.7-1.0)
         fixed_delays = 1.0+stiffness_delay
         total_N = ideal_N-(0.5*fixed_delays) # The -1.0 is for damping filter
         if total_N<1.1:
             total_N=1.1
-        self.buffer_size = int(total_N)
-        residue = total_N - self.buffer_size
-        self.frac_c = (1.0-(2.0*residue))/(1.0 + (2.0*residue))
+        buffer_size = int(total_N)
+        residue = total_N - buffer_size
+        frac_c = (1.0-(2.0*residue))/(1.0 + (2.0*residue))
+        return buffer_size, frac_c, current_damping, new_alpha, stiffness_a
+
+    @override
+    def set_frequency(self, frequency:float=440.0,sustain_time:float=4.0, table:list = None):
+        self.frequency = frequency
+        self.buffer_size, self.frac_c, self.current_damping, alpha, self.stiffness.a = \
+            tuning.lookup(self, frequency, sustain_time, table)
+        self.damping_filter.set_alpha(alpha)
 
         if self.buffer_size >= self.max_size:
-            extension = [0.0] * (self.buffer_size - self.max_size +100)
-            self.right_buffer.extend(extension)
-            self.left_buffer.extend(extension)
+            extension = np.zeros(self.buffer_size - self.max_size +100, dtype=self.dtype)
+            self.right_buffer = np.concatenate((self.right_buffer, extension))
+            self.left_buffer = np.concatenate((self.left_buffer, extension))
             self.max_size = len(self.right_buffer)
 
         return
@@ -85,8 +127,10 @@ class DigitalWaveguideStrategy(IPhysicsStrategy):
         return self.right_buffer[idx]+self.left_buffer[idx]
 
     def excite(self, velocity:float, pluck_position:float = 0.2):
-        self.right_buffer = [0.0] * self.max_size
-        self.left_buffer = [0.0] * self.max_size
+        self.awake = True
+        # Reuse the rails in place (the string bank holds views into them)
+        self.right_buffer.fill(0.0)
+        self.left_buffer.fill(0.0)
         
         # Reset Utility States
         self.fractional_delay.reset()
@@ -94,62 +138,75 @@ class DigitalWaveguideStrategy(IPhysicsStrategy):
         self.stiffness.reset()
 
         pluck_pos = max(1, min(int(self.buffer_size * pluck_position), self.buffer_size - 1))
-        
         # [NEW] Smoothed Pluck Top (Simulates finger width)
         width = max(2, self.config.pluck_width)
-        
-        for i in range(self.buffer_size):
-            current_point = (self.ptr + i)%self.buffer_size
-            
-            # 1. Calculate Ideal Sharp Triangle
-            if i <= pluck_pos:
-                val = 0.5 * velocity * (i / pluck_pos)
-            else:
-                val = 0.5 * velocity * ((self.buffer_size - i) / (self.buffer_size - pluck_pos))
-            
-            # 2. Smooth the tip using a simple polynomial window
-            # If we are within 'width' of the pluck position, round it off
-            dist = abs(i - pluck_pos)
-            if dist < width:
-                # Quadratic smoothing: val * (1 - (dist/width)^2 * scaling)
-                # This makes the sharp point a parabola
-                correction = (dist / width) ** 2
-                val = val * (1.0 - 0.2 * (1.0 - correction)) 
-
-            self.right_buffer[current_point] = val
-            self.left_buffer[current_point] = val
+        shape = _pluck_shape(self.buffer_size, pluck_pos, width)
+
+        # Lay the shape out starting at the read pointer, scaled by velocity
+        start = self.ptr % self.buffer_size
+        split = self.buffer_size - start
+        np.multiply(shape[:split], velocity, out=self.right_buffer[start:self.buffer_size])
+        np.multiply(shape[split:], velocity, out=self.right_buffer[:start])
+        self.left_buffer[:self.buffer_size] = self.right_buffer[:self.buffer_size]
+
+    def get_peak_level(self) -> float:
+        """Largest displacement stored anywhere on the string."""
+        b = self.buffer_size
+        right = self.right_buffer[:b]
+        left = self.left_buffer[:b]
+        return max(kernels.peak(right), kernels.peak(left))
+
+    def sleep(self):
+        """Zeroes the string so decayed (subnormal) values stop costing anything."""
+        self.right_buffer[:] = 0.0
+        self.left_buffer[:] = 0.0
+        self.fractional_delay.reset()
+        self.damping_filter.reset()
+        self.stiffness.reset()
+        self.awake = False
 
     # Alpha is used for filtering. We'll take alpha*prev sample and average it with (1-a)*current sample
     # Alpha 0.05-0.1 is good for metal strings
     # Alpha 0.2-0.3 is good for Nylon strings
     # Alpha 0.5 is good for old/dead strings
     # Alpha 0.8 is good for palm muted strumming
-    def process(self, num_samples :int,selector:str = 'acoustic'):
+    def process(self, num_samples :int,selector:str = 'acoustic', out:np.ndarray = None):
+        return kernels.get_backend().waveguide(self, num_samples, out)
 
-        ptr = self.ptr
+    def get_pickup_offsets(self) -> np.ndarray:
+        """Shared cached array, do not modify."""
+        ratios=self.pickup_locations.get("all",[0.2])
+        return _pickup_offsets(self.buffer_size, tuple(ratios))
+
+    def process_chunks(self, num_samples :int) -> np.ndarray:
         wd_right = self.right_buffer
         wd_left = self.left_buffer
         buff_size = self.buffer_size
 
         use_bridge = self.config.use_bridge_output
 
-        chunk_size = 64
-        output = np.zeros(num_samples)
-        pickup_offsets=[]
+        # A sample written at idx is read back exactly buff_size samples later,
+        # so any chunk up to buff_size long only reads values that are already there
+        chunk_size = buff_size
+        output = np.empty(num_samples, dtype=self.dtype)
+        ramp = np.arange(min(chunk_size, num_samples))
 
         if not use_bridge:
-            ratios=self.pickup_locations.get("all",[0.2])
-            for r in ratios :
-                offset = int(buff_size *r)
-                pickup_offsets.append(offset)
-        num_pickups = max(1,len(pickup_offsets))
+            pickup_offsets = self.get_pickup_offsets()
+            # Pickup k reads idx_k+off after write k. It sees this chunk's fresh value
+            # when that slot was already written (off == 0 or it wrapped past the
+            # chunk start), otherwise the value from before the chunk.
+            pickup_ramp = ramp[:, None] + pickup_offsets[None, :]
+            pickup_fresh = (pickup_ramp >= buff_size) | (pickup_offsets[None, :] == 0)
+            num_pickups = max(1, len(pickup_offsets))
 
         processed = 0
         while processed < num_samples:
             current_chunk = min(chunk_size, num_samples - processed)
-            indices = (np.arange(current_chunk) + self.ptr) % buff_size
-            val_bridge = np.array([wd_right[i] for i in indices])
-            val_nut = np.array([wd_left[i] for i in indices])
+            indices = ramp[:current_chunk] + self.ptr
+            indices %= buff_size
+            val_bridge = wd_right[indices]
+            val_nut = wd_left[indices]
 
             filtered_bridge = self.damping_filter.process_vector(val_bridge)
             stiff_bridge = self.stiffness.process_vector(filtered_bridge)
@@ -157,22 +214,21 @@ class DigitalWaveguideStrategy(IPhysicsStrategy):
             inv_nut = -1 * val_nut
             nut_reflection = self.fractional_delay.process_vector(inv_nut, self.frac_c)
 
-            left_write = -stiff_bridge * self.current_damping
-            right_write = nut_reflection
-
-            for k in range(current_chunk):
-                idx = indices[k]
-                wd_left[idx] = left_write[k]
-                wd_right[idx] = right_write[k]
-
-                if use_bridge:
-                    output[processed + k] = filtered_bridge[k]
-                else:
-                    s = 0.0
-                    for off in pickup_offsets:
-                        pidx = (idx+off)%buff_size
-                        s += wd_right[pidx] + wd_left[pidx]
-                    output[processed + k] = s/num_pickups
+            if not use_bridge:
+                pickup_idx = pickup_ramp[:current_chunk] + self.ptr
+                pickup_idx %= buff_size
+                before = wd_right[pickup_idx] + wd_left[pickup_idx]
+
+            wd_left[indices] = -stiff_bridge * self.current_damping
+            wd_right[indices] = nut_reflection
+
+            if use_bridge:
+                output[processed:processed + current_chunk] = filtered_bridge
+            else:
+                after = wd_right[pickup_idx] + wd_left[pickup_idx]
+                picked = np.where(pickup_fresh[:current_chunk], after, before)
+                output[processed:processed + current_chunk] = picked.sum(axis=1) / num_pickups
+
             self.ptr = (self.ptr + current_chunk) % buff_size
             processed += current_chunk
             
@@ -1,79 +1,289 @@
 from .core import IPhysicsStrategy, InstrumentConfig
 from .utils import FractionalDelay, StiffnessDispersion
+from . import kernels, tuning
+import time
 import numpy as np
 from scipy.signal import lfilter
+from functools import lru_cache
+
+def _lfilter(b, a, x, axis, zi):
+    return lfilter(b, a, x, axis=axis, zi=zi)
+
+def _checked_linear_filter():
+    """
+    lfilter's C core. A period is often only a few hundred samples, and on calls that short
+    lfilter's argument checks cost more than the filtering. It is private to SciPy, so it is
+    only used when it exists and gives lfilter's result here, once at import; lfilter otherwise.
+    """
+    try:
+        from scipy.signal._sigtools import _linear_filter
+        rng = np.random.default_rng(0)
+        b, a = np.array([0.2, 0.5, 0.3]), np.array([1.0, 0.4])
+        for x, zi in ((rng.standard_normal(32), rng.standard_normal(2)),
+                      (rng.standard_normal((32, 3)), rng.standard_normal((2, 3)))):
+            y, zf = _linear_filter(b, a, x, 0, zi)
+            y_ref, zf_ref = lfilter(b, a, x, axis=0, zi=zi)
+            if not (np.allclose(y, y_ref) and np.allclose(zf, zf_ref)):
+                return _lfilter
+        return _linear_filter
+    except Exception:
+        return _lfilter
+
+_linear_filter = _checked_linear_filter()
+
+# Loops are skipped ahead up to MATRIX_BLOCK samples per matrix product (blocks are powers of
+# two down to MATRIX_MIN_BLOCK) when that is cheaper than one filter call per period
+MATRIX_BLOCK = 512
+MATRIX_MIN_BLOCK = 64
+
+# Seconds per filter call, per matrix product call and per matrix multiply-add on a typical
+# machine. NumpyBackend.warm_up measures this machine's (measure_loop_costs) and passes them on
+DEFAULT_LOOP_COSTS = {"filter_call": 4e-6, "matrix_call": 2e-6, "matrix_mac": 2.2e-10}
+
+@lru_cache(maxsize=256)
+def _loop_filter(c:float, g:float, dtype=np.float64):
+    """
+    Two-point lowpass and fractional allpass merged into one filter driven by x[k+1]:
+    y[k] = c*lp[k] + lp[k-1] - c*y[k-1],  lp[k] = g*(0.48*x[k] + 0.52*x[k+1])
+    """
+    b = np.array([0.52*g*c, (0.48*c + 0.52)*g, 0.48*g], dtype=dtype)
+    a = np.array([1.0, c], dtype=dtype)
+    return b, a
+
+def _render_periods(x:np.ndarray, N:int, start:int, stop:int, b, a, zi):
+    """Fills x[start+N:stop+N] along axis 0, at most N-1 samples per filter call."""
+    chunk_size = max(1, N - 1)
+    processed = start
+    while processed < stop:
+        current_chunk = min(chunk_size, stop - processed)
+        x[processed + N:processed + N + current_chunk], zi = _linear_filter(
+            b, a, x[processed + 1:processed + 1 + current_chunk], 0, zi)
+        processed += current_chunk
+    return zi
+
+def _matrix_block(N:int, remaining:int, costs:dict) -> int:
+    """
+    The matrix block to jump next, 0 when rendering period by period is cheaper. Per sample a
+    period costs a filter call over N-1 samples, a matrix jump N+2 multiply-adds plus its call.
+    """
+    if remaining < MATRIX_MIN_BLOCK:
+        return 0
+    block = min(MATRIX_BLOCK, 1 << (remaining.bit_length() - 1))
+    matrix = costs["matrix_call"]/block + (N + 2)*costs["matrix_mac"]
+    periods = costs["filter_call"]/max(1, N - 1)
+    return block if matrix < periods else 0
+
+def measure_loop_costs(repeats:int = 200) -> dict:
+    """Times a filter call and matrix products on this machine, in DEFAULT_LOOP_COSTS' form."""
+    def best(fn):
+        fn()
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                fn()
+            timings.append((time.perf_counter() - start) / repeats)
+        return min(timings)
+
+    b, a = _loop_filter(0.5, 0.99)
+    x = np.zeros(MATRIX_BLOCK + 2)
+    zi = np.zeros(2)
+    filter_call = best(lambda: _linear_filter(b, a, x[:64], 0, zi))
+    small, large = 64, 256
+    matrices = {n: np.zeros((MATRIX_BLOCK + 2, n + 2)) for n in (small, large)}
+    products = {n: best(lambda n=n: matrices[n] @ x[:n + 2]) for n in (small, large)}
+    mac = max(1e-12, (products[large] - products[small]) / ((MATRIX_BLOCK + 2)*(large - small)))
+    return {"filter_call": filter_call, "matrix_mac": mac,
+            "matrix_call": max(0.0, products[small] - (MATRIX_BLOCK + 2)*(small + 2)*mac)}
+
+# The loop buffer is sized for notes down to MIN_FREQUENCY, so retuning a string only takes a
+# view of it. Lower notes reallocate it
+MIN_FREQUENCY = 20.0
+PLUCK_NOISE_SIZE = 1 << 16
+
+@lru_cache(maxsize=16)
+def _pluck_noise(alpha:float, dtype=np.float64) -> np.ndarray:
+    """
+    Excitation noise: white noise through the excitation's poles, leaky integrator (pink-ish
+    'thump') -> one-pole lowpass. The pluck position comb y[n] = x[n] - x[n-p] commutes with
+    them, so a pluck is one subtraction over a random window of this.
+    """
+    white = np.random.default_rng(0).uniform(-1.0, 1.0, PLUCK_NOISE_SIZE)
+    a = np.convolve([1.0, -0.5/1.5], [1.0, -(1.0-alpha)])
+    return lfilter([alpha/1.5], a, white).astype(dtype)
+
+@lru_cache(maxsize=64)
+def _loop_transfer_matrix(N:int, c:float, g:float, dtype=np.float64, block:int = MATRIX_BLOCK) -> np.ndarray:
+    """
+    The loop is linear, so `block` samples ahead are a fixed linear map of the
+    current state [loop content (N), filter state (2)]. Built by pushing every basis
+    vector through the period renderer at once.
+    """
+    b, a = _loop_filter(c, g)
+    basis = np.zeros((block + N, N + 2))
+    basis[:N, :N] = np.eye(N)
+    zi = np.zeros((2, N + 2))
+    zi[0, N] = 1.0
+    zi[1, N + 1] = 1.0
+    zf = _render_periods(basis, N, 0, block, b, a, zi)
+    # Built in double precision, stored in the string's precision
+    return np.vstack((basis[N:], zf)).astype(dtype)
 
 
 class KarplusStrongAlgorithm(IPhysicsStrategy):
-    def __init__(self, sample_rate :int = 44100, frequency:float=440.0, config: InstrumentConfig=InstrumentConfig()) -> None:
+    def __init__(self, sample_rate :int = 44100, frequency:float=440.0, config: InstrumentConfig=InstrumentConfig(), period_chunked:bool=True, dtype=np.float64) -> None:
         self.sample_rate = sample_rate
+        # Sample precision of the loop and its filter state (np.float32 halves the memory traffic)
+        self.dtype = dtype
         self.config = config
         self.frequency = frequency
+        # NumPy backend only: True = render a loop period per lfilter call, False = reference per-sample loop
+        self.period_chunked = period_chunked
         #self.decay_factor = decay_factor
         self.fractional_delay=FractionalDelay()
         self.stiffness = StiffnessDispersion(stiffness=config.stiffness)
 
         self.N = int(sample_rate / frequency)
-        self.delay_line = np.zeros(2)
+        self._loop = np.zeros(int(sample_rate / MIN_FREQUENCY) + 1, dtype=dtype)
+        self.delay_line = self._loop[:2]
+        # process_periods scratch: the unrolled timeline (loop + one block, grown for longer
+        # blocks), the matrix jump's input state and its output
+        self._timeline = np.zeros(len(self._loop) + 4096, dtype=dtype)
+        self._jump_state = np.zeros(len(self._loop) + 2, dtype=dtype)
+        self._jump_out = np.zeros(MATRIX_BLOCK + 2, dtype=dtype)
         self.ptr = 0
-
+        self.awake = False # False = silent, the instrument skips this string until the next excite
+        # Picks the window of the excitation noise each pluck starts from
+        self.rng = np.random.default_rng(kernels.global_seed())
+        self.kernel_state = np.zeros(2, dtype=dtype)
 
         self.set_frequency(frequency)
 
-    def set_frequency(self, freq:float, sustain_time: float=4.0):
-        self.frequency = freq
+    def tuning_key(self, sustain_time:float, stiffness:float = None) -> tuple:
+        """Everything besides the frequency that compute_tuning depends on (not the stiffness)."""
+        return (type(self), self.sample_rate, sustain_time)
 
+    def compute_tuning(self, freq:float, sustain_time:float, stiffness:float = None) -> tuple:
+        """Derives the loop parameters for a frequency without touching the string's state."""
         ideal_T = self.sample_rate/freq
         stiffness_delay = 0
 
         total_T = ideal_T-0.52-stiffness_delay
         if total_T<2.1:
             total_T =2.1
-        self.N = int(total_T)
+        N = int(total_T)
 
-        residue = total_T - self.N
-        self.frac_c = (1.0-residue)/(1.0+residue)
+        residue = total_T - N
+        frac_c = (1.0-residue)/(1.0+residue)
         target_gain = 10**(-3/(freq*sustain_time))
         w=2*np.pi*freq/self.sample_rate
         filter_gain = np.sqrt(0.48**2+0.52**2+2*0.48*0.52*np.cos(w))
-        self.decay_factor= min(0.999,target_gain/filter_gain)
+        decay_factor= min(0.999,target_gain/filter_gain)
+        return N, frac_c, decay_factor
+
+    def set_frequency(self, freq:float, sustain_time: float=4.0, table:list = None):
+        self.frequency = freq
+        self.N, self.frac_c, self.decay_factor = tuning.lookup(self, freq, sustain_time, table)
         if len(self.delay_line)!=self.N:
-            self.delay_line = np.zeros(self.N)
-            self.ptr =0
-    
+            self._resize_loop()
+
+    def _resize_loop(self):
+        if len(self._loop) < self.N:
+            self._loop = np.zeros(self.N, dtype=self.dtype)
+            self._jump_state = np.zeros(self.N + 2, dtype=self.dtype)
+        self.delay_line = self._loop[:self.N]
+        self.delay_line[:] = 0.0
+        self.ptr = 0
+
     def excite(self, velocity :float, cutoff_frequency:float=4000, pluck_position:float=0.2):
+        self.awake = True
         # Reset filter states to prevent instability
         self.fractional_delay.reset()
         self.stiffness.reset()
-        
-        white = np.random.uniform(-1.0, 1.0, self.N)
-
-        # Filter into pink noise (1/f approx)
-        # We use a simple integrator to boost the 'thump'  
-        burst = np.zeros(self.N)
-        last_val = 0
-        for i in range(self.N):
-            white[i] = (white[i] + (0.5 * last_val)) / 1.5 # Leaky itegrator
-            last_val = white[i]
-        burst = white
 
         pluck_samples = int(self.N * pluck_position)
         pluck_samples = max(1, min(pluck_samples, self.N -2))
 
-        #combfilter: y[n] = x[n] - x[n-p]
-        combed_burst = np.zeros(self.N)
-        combed_burst[pluck_samples:] = burst[pluck_samples:]- burst[:-pluck_samples]
-        combed_burst[:pluck_samples] = burst [:pluck_samples]
-
-
         alpha:float = (2.0* np.pi * cutoff_frequency) / (self.sample_rate+2.0*np.pi*cutoff_frequency)
-        filtered_burst = lfilter([alpha], [1, -(1-alpha)],combed_burst)
-        self.delay_line = filtered_burst * velocity
+        noise = _pluck_noise(alpha, self.dtype)
+        if len(self.delay_line) != self.N:
+            self._resize_loop()
+        # Written straight into the loop, a pluck allocates nothing
+        start = int(self.rng.integers(pluck_samples, len(noise) - self.N))
+        np.subtract(noise[start:start + self.N], noise[start - pluck_samples:start - pluck_samples + self.N],
+                    out=self.delay_line)
+        self.delay_line *= velocity
         self.ptr = 0
 
+    def get_peak_level(self) -> float:
+        """Largest value circulating in the loop."""
+        return kernels.peak(self.delay_line)
+
+    def sleep(self):
+        """Zeroes the loop so decayed (subnormal) values stop costing anything."""
+        self.delay_line[:] = 0.0
+        self.fractional_delay.reset()
+        self.stiffness.reset()
+        self.awake = False
+
+    def process(self, num_samples: int, out:np.ndarray = None) -> np.ndarray:
+        return kernels.get_backend().karplus_strong(self, num_samples, out)
+
+    def process_periods(self, num_samples: int, costs:dict = None) -> np.ndarray:
+        """
+        Same recursion as process_per_sample, rendered a loop period at a time.
+        A value written into the loop is only read back N samples later, so a chunk
+        shorter than N depends only on values already in the delay line.
+        costs (DEFAULT_LOOP_COSTS when None) decide when matrix jumps beat rendering periods.
+        Returns a view of the string's scratch, overwritten by the next call.
+        """
+        costs = costs or DEFAULT_LOOP_COSTS
+        local_N = len(self.delay_line)
+        if num_samples <= 0:
+            return np.zeros(0, dtype=self.dtype)
+
+        # Unroll the ring into a linear timeline: x[0:N] is the current loop content,
+        # x[k+N] is the value written back while reading x[k]
+        if len(self._timeline) < num_samples + local_N:
+            self._timeline = np.zeros(num_samples + local_N, dtype=self.dtype)
+        x = self._timeline[:num_samples + local_N]
+        x[:local_N - self.ptr] = self.delay_line[self.ptr:]
+        x[local_N - self.ptr:local_N] = self.delay_line[:self.ptr]
+
+        c = self.frac_c
+        g = self.decay_factor
+        b, a = _loop_filter(c, g, self.dtype)
+        lp_prev = self.fractional_delay.x_prev
+        y_prev = self.fractional_delay.y_prev
+        zi = np.array([0.48*g*c*x[0] + lp_prev - c*y_prev, 0.48*g*x[0]], dtype=self.dtype)
+
+        processed = 0
+        # Short loops: a period is only a handful of samples, so jump a whole
+        # sub-block at once with the precomputed loop transfer matrix
+        block = _matrix_block(local_N, num_samples, costs)
+        state = self._jump_state[:local_N + 2]
+        while block:
+            transfer = _loop_transfer_matrix(local_N, c, g, self.dtype, block)
+            state[:local_N] = x[processed:processed + local_N]
+            state[local_N:] = zi
+            step = np.matmul(transfer, state, out=self._jump_out[:block + 2])
+            x[processed + local_N:processed + local_N + block] = step[:block]
+            zi = step[block:]
+            processed += block
+            block = _matrix_block(local_N, num_samples - processed, costs)
+
+        _render_periods(x, local_N, processed, num_samples, b, a, zi)
+
+        # Hand the loop back to the ring buffer and the allpass state
+        last = num_samples - 1
+        self.fractional_delay.x_prev = g*(0.48*x[last] + 0.52*x[last + 1])
+        self.fractional_delay.y_prev = x[last + local_N]
+        self.delay_line[:] = x[num_samples:]
+        self.ptr = 0
+        return x[:num_samples]
 
-    def process(self, num_samples: int) -> np.ndarray:
-        output = np.zeros(num_samples)
+    def process_per_sample(self, num_samples: int) -> np.ndarray:
+        output = np.zeros(num_samples, dtype=self.dtype)
 
         local_delay = self.delay_line
         local_N = len(local_delay)
@@ -0,0 +1,376 @@
+"""
+Kernel backends for the per-sample DSP loops.
+
+The string models are recursive (every sample feeds back into the loop), which is
+slow in CPython. A backend owns the inner loop of each strategy:
+ - "numpy": the vectorized NumPy/SciPy code already living on the strategies
+ - "numba": the same recursions as plain loops, JIT compiled (only if numba imports)
+
+The numba backend is picked automatically when available. Set
+SOUND_GEN_KERNELS=numpy to force the fallback, and SOUND_GEN_NUMBA_CACHE=0 to keep
+compiled kernels out of __pycache__.
+"""
+from abc import ABC, abstractmethod
+import os
+import numpy as np
+from scipy.signal import sosfilt
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def peak(x:np.ndarray) -> float:
+    """Largest absolute value. max/-min instead of abs() keeps this free of temporaries."""
+    return max(x.max(), -x.min())
+
+def global_seed() -> int:
+    """
+    Seed for a component's own Generator (noise, pluck windows), drawn from NumPy's global one
+    so np.random.seed still makes renders repeatable.
+    """
+    return int(np.random.randint(2**32))
+
+
+class IKernelBackend(ABC):
+    name = ""
+
+    # Every render method writes into `out` when given (and returns it), so callers can
+    # hand in preallocated buffers
+
+    @abstractmethod
+    def karplus_strong(self, string, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def waveguide(self, string, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def body(self, body, signal:np.ndarray, noise:np.ndarray, out:np.ndarray) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def stereo_body(self, body, signal:np.ndarray, out:np.ndarray, gain:float) -> np.ndarray:
+        pass
+
+    def warm_up(self):
+        """Hook for backends that need to compile before the first note."""
+        pass
+
+
+class NumpyBackend(IKernelBackend):
+    name = "numpy"
+
+    def __init__(self):
+        # Karplus-Strong loop costs of this machine once warm_up measured them, the defaults until then
+        self.loop_costs = None
+
+    def karplus_strong(self, string, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        if string.period_chunked:
+            output = string.process_periods(num_samples, self.loop_costs)
+            if out is None:
+                # A view of the string's scratch, the next block overwrites it
+                return output.copy()
+        else:
+            output = string.process_per_sample(num_samples)
+            if out is None:
+                return output
+        out[:] = output
+        return out
+
+    def waveguide(self, string, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        output = string.process_chunks(num_samples)
+        if out is None:
+            return output
+        out[:] = output
+        return out
+
+    def body(self, body, signal:np.ndarray, noise:np.ndarray, out:np.ndarray) -> np.ndarray:
+        #Apply Wood Damping (low Pass)
+        filtered_signal, body.zi = sosfilt(body.sos, signal, zi=body.zi)
+        #Apply Helmholtz Resonance (Bandpass)
+        boom, body.bp_zi = sosfilt(body.bp_sos, signal, zi=body.bp_zi)
+
+        np.multiply(boom, 1.5, out=boom)
+        np.add(filtered_signal, boom, out=out)
+        np.multiply(noise, body.noise_gain, out=noise)
+        np.add(out, noise, out=out)
+        return np.tanh(out, out=out)
+
+    def stereo_body(self, body, signal:np.ndarray, out:np.ndarray, gain:float) -> np.ndarray:
+        filtered, body.zi = sosfilt(body.sos, signal, zi=body.zi)
+        noise = body.noise_block(len(signal))
+        for c in range(body.channels):
+            boom, body.bp_zi[c] = sosfilt(body.bp_sos[c], signal, zi=body.bp_zi[c])
+            np.multiply(boom, 1.5, out=boom)
+            np.add(boom, filtered, out=boom)
+            np.add(boom, noise[c], out=boom)
+            if body.saturation == "soft":
+                _soft_clip(boom)
+            else:
+                np.tanh(boom, out=boom)
+            np.multiply(boom, gain, out=out[:, c])
+        return out
+
+    def warm_up(self):
+        """Measures this machine's filter call and matrix costs, which pick the Karplus-Strong path per loop length."""
+        from .karplus_strong import measure_loop_costs
+        self.loop_costs = measure_loop_costs()
+
+
+def _soft_clip(x:np.ndarray) -> np.ndarray:
+    # Rational tanh approximation, exact +-1 at +-3 and flat beyond
+    np.clip(x, -3.0, 3.0, out=x)
+    x2 = x*x
+    x *= (27.0 + x2)
+    x /= 27.0 + 9.0*x2
+    return x
+
+
+# --- Plain-loop kernels. Compiled by NumbaBackend, state arrays are updated in place ---
+
+def _karplus_strong_kernel(delay_line, ptr, num_samples, decay, c, ap_state, output):
+    N = delay_line.shape[0]
+    for i in range(num_samples):
+        current_val = delay_line[ptr]
+        output[i] = current_val
+
+        next_ptr = ptr + 1
+        if next_ptr == N:
+            next_ptr = 0
+        lowpassed_val = (0.48*current_val + 0.52*delay_line[next_ptr]) * decay
+
+        # Fractional allpass, y[n] = c*x[n] + x[n-1] - c*y[n-1]
+        y_n = c*lowpassed_val + ap_state[0] - c*ap_state[1]
+        ap_state[0] = lowpassed_val
+        ap_state[1] = y_n
+
+        delay_line[ptr] = y_n
+        ptr = next_ptr
+    return ptr
+
+def _waveguide_kernel(right, left, buff_size, ptr, num_samples, use_bridge, pickup_offsets,
+                      lp_alpha, stiff_sos, stiff_zi, frac_c, state, damping, output):
+    # state = [lowpass y[n-1], allpass x[n-1], allpass y[n-1]]
+    num_pickups = max(1, pickup_offsets.shape[0])
+    for n in range(num_samples):
+        val_bridge = right[ptr]
+        val_nut = left[ptr]
+
+        # Damping lowpass, y[n] = (1-alpha)*x[n] + alpha*y[n-1]
+        filtered = (1.0 - lp_alpha)*val_bridge + lp_alpha*state[0]
+        state[0] = filtered
+
+        # Dispersion cascade, second-order sections in the same order as sosfilt
+        current = filtered
+        for s in range(stiff_sos.shape[0]):
+            out = stiff_sos[s, 0]*current + stiff_zi[s, 0]
+            stiff_zi[s, 0] = stiff_sos[s, 1]*current - stiff_sos[s, 4]*out + stiff_zi[s, 1]
+            stiff_zi[s, 1] = stiff_sos[s, 2]*current - stiff_sos[s, 5]*out
+            current = out
+
+        # Inverted nut reflection through the tuning allpass
+        inv_nut = -val_nut
+        reflected = frac_c*inv_nut + (state[1] - frac_c*state[2])
+        state[1] = inv_nut
+        state[2] = reflected
+
+        left[ptr] = -current * damping
+        right[ptr] = reflected
+
+        if use_bridge:
+            output[n] = filtered
+        else:
+            s = 0.0
+            for off in pickup_offsets:
+                pidx = (ptr + off) % buff_size
+                s += right[pidx] + left[pidx]
+            output[n] = s / num_pickups
+
+        ptr += 1
+        if ptr >= buff_size:
+            ptr = 0
+    return ptr
+
+def _body_kernel(signal, sos, zi, bp_sos, bp_zi, noise, noise_gain, out):
+    # Wood lowpass and Helmholtz bandpass as second-order sections in sosfilt's order,
+    # states updated in place
+    for n in range(signal.shape[0]):
+        x = signal[n]
+
+        filtered = x
+        for s in range(sos.shape[0]):
+            y = sos[s, 0]*filtered + zi[s, 0]
+            zi[s, 0] = sos[s, 1]*filtered - sos[s, 4]*y + zi[s, 1]
+            zi[s, 1] = sos[s, 2]*filtered - sos[s, 5]*y
+            filtered = y
+
+        boom = x
+        for s in range(bp_sos.shape[0]):
+            y = bp_sos[s, 0]*boom + bp_zi[s, 0]
+            bp_zi[s, 0] = bp_sos[s, 1]*boom - bp_sos[s, 4]*y + bp_zi[s, 1]
+            bp_zi[s, 1] = bp_sos[s, 2]*boom - bp_sos[s, 5]*y
+            boom = y
+
+        out[n] = np.tanh(filtered + boom*1.5 + noise[n]*noise_gain)
+
+def _stereo_body_kernel(signal, sos, zi, bp_sos, bp_zi, noise, noise_pos, soft, gain, out):
+    # Shared lowpass once per sample, then one bandpass per channel. noise is the looping
+    # (channels, length) table, the new read position is returned
+    length = noise.shape[1]
+    for n in range(signal.shape[0]):
+        x = signal[n]
+
+        filtered = x
+        for s in range(sos.shape[0]):
+            y = sos[s, 0]*filtered + zi[s, 0]
+            zi[s, 0] = sos[s, 1]*filtered - sos[s, 4]*y + zi[s, 1]
+            zi[s, 1] = sos[s, 2]*filtered - sos[s, 5]*y
+            filtered = y
+
+        for c in range(bp_sos.shape[0]):
+            boom = x
+            for s in range(bp_sos.shape[1]):
+                y = bp_sos[c, s, 0]*boom + bp_zi[c, s, 0]
+                bp_zi[c, s, 0] = bp_sos[c, s, 1]*boom - bp_sos[c, s, 4]*y + bp_zi[c, s, 1]
+                bp_zi[c, s, 1] = bp_sos[c, s, 2]*boom - bp_sos[c, s, 5]*y
+                boom = y
+
+            v = filtered + boom*1.5 + noise[c, noise_pos]
+            if soft:
+                v = min(max(v, -3.0), 3.0)
+                v = v*(27.0 + v*v) / (27.0 + 9.0*v*v)
+            else:
+                v = np.tanh(v)
+            out[n, c] = gain*v
+
+        noise_pos += 1
+        if noise_pos == length:
+            noise_pos = 0
+    return noise_pos
+
+
+_NO_PICKUPS = np.zeros(0, dtype=np.int64)
+
+
+class NumbaBackend(IKernelBackend):
+    name = "numba"
+
+    def __init__(self, cache:bool = True):
+        # cache=True stores the machine code next to this module, so later runs
+        # skip compilation entirely. nogil: a kernel running on one thread (the callback, the
+        # note cache's renderer) does not stall the others
+        self.cache = cache
+        self._karplus_strong = numba.njit(cache=cache, nogil=True)(_karplus_strong_kernel)
+        self._waveguide = numba.njit(cache=cache, nogil=True)(_waveguide_kernel)
+        self._body = numba.njit(cache=cache, nogil=True)(_body_kernel)
+        self._stereo_body = numba.njit(cache=cache, nogil=True)(_stereo_body_kernel)
+
+    # The wrappers pack the filter objects' state into each strategy's kernel_state scratch
+    # and unpack it afterwards, so a block allocates nothing when `out` is given
+
+    # Scalars are passed in the string's precision, so float32 strings get their own
+    # float32 specialization instead of being promoted to double
+
+    def karplus_strong(self, string, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        output = np.empty(num_samples, dtype=string.dtype) if out is None else out
+        ap = string.fractional_delay
+        state = string.kernel_state
+        scalar = state.dtype.type
+        state[0] = ap.x_prev
+        state[1] = ap.y_prev
+        string.ptr = self._karplus_strong(string.delay_line, int(string.ptr), num_samples,
+                                          scalar(string.decay_factor), scalar(string.frac_c),
+                                          state, output)
+        ap.x_prev = state[0]
+        ap.y_prev = state[1]
+        return output
+
+    def waveguide(self, string, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        output = np.empty(num_samples, dtype=string.dtype) if out is None else out
+        lp = string.damping_filter
+        sd = string.stiffness
+        ap = string.fractional_delay
+
+        state = string.kernel_state
+        scalar = state.dtype.type
+        state[0] = lp.prev_output
+        state[1] = ap.x_prev
+        state[2] = ap.y_prev
+        use_bridge = bool(string.config.use_bridge_output)
+        if use_bridge:
+            pickup_offsets = _NO_PICKUPS
+        else:
+            pickup_offsets = string.get_pickup_offsets()
+
+        # sd.zi belongs to this string, the kernel advances it in place
+        string.ptr = self._waveguide(string.right_buffer, string.left_buffer, int(string.buffer_size),
+                                     int(string.ptr) % string.buffer_size, num_samples, use_bridge,
+                                     pickup_offsets, scalar(lp.alpha), sd.sos, sd.zi,
+                                     scalar(string.frac_c), state, scalar(string.current_damping), output)
+
+        lp.prev_output = state[0]
+        ap.x_prev = state[1]
+        ap.y_prev = state[2]
+        return output
+
+    def body(self, body, signal:np.ndarray, noise:np.ndarray, out:np.ndarray) -> np.ndarray:
+        self._body(signal, body.sos, body.zi, body.bp_sos, body.bp_zi,
+                   noise, body.zi.dtype.type(body.noise_gain), out)
+        return out
+
+    def stereo_body(self, body, signal:np.ndarray, out:np.ndarray, gain:float) -> np.ndarray:
+        body.noise_pos = self._stereo_body(signal, body.sos, body.zi, body.bp_sos, body.bp_zi, body.noise,
+                                           int(body.noise_pos), body.saturation == "soft",
+                                           body.zi.dtype.type(gain), out)
+        return out
+
+    def warm_up(self):
+        """Compiles (or loads from the disk cache) every kernel with the real signatures, in both precisions."""
+        for dtype in (np.float64, np.float32):
+            zeros = lambda *shape: np.zeros(shape, dtype=dtype)
+            ones = lambda *shape: np.ones(shape, dtype=dtype)
+            scalar = dtype
+            output = zeros(4)
+            self._karplus_strong(zeros(4), 0, 4, scalar(0.99), scalar(0.5), zeros(2), output)
+            for use_bridge in (True, False):
+                self._waveguide(zeros(4), zeros(4), 4, 0, 4, use_bridge, np.zeros(1, dtype=np.int64),
+                                scalar(0.2), zeros(6, 6), zeros(6, 2), scalar(0.5), zeros(3), scalar(0.99), output)
+            self._body(zeros(4), ones(1, 6), zeros(1, 2), ones(2, 6), zeros(2, 2),
+                       zeros(4), scalar(0.0002), output)
+            # The stereo body also writes straight into device buffers of either precision
+            for out_dtype in (np.float64, np.float32):
+                for soft in (False, True):
+                    self._stereo_body(zeros(4), ones(1, 6), zeros(1, 2), ones(2, 2, 6), zeros(2, 2, 2),
+                                      zeros(2, 4), 0, soft, scalar(1.0), np.zeros((4, 2), dtype=out_dtype))
+
+
+_BACKENDS: dict[str, IKernelBackend] = {}
+_active: IKernelBackend = None
+
+def register_backend(backend: IKernelBackend):
+    _BACKENDS[backend.name] = backend
+
+def available_backends() -> list[str]:
+    return list(_BACKENDS)
+
+def set_backend(name:str) -> IKernelBackend:
+    global _active
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown kernel backend '{name}', available: {available_backends()}")
+    _active = _BACKENDS[name]
+    return _active
+
+def get_backend(name:str = None) -> IKernelBackend:
+    if name is None:
+        return _active
+    return _BACKENDS[name]
+
+
+register_backend(NumpyBackend())
+if numba is not None:
+    register_backend(NumbaBackend(cache=os.environ.get("SOUND_GEN_NUMBA_CACHE", "1") != "0"))
+
+set_backend(os.environ.get("SOUND_GEN_KERNELS", "numba" if numba is not None else "numpy"))
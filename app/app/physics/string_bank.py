@@ -0,0 +1,193 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import lfilter, sosfilt
+from .dwg import DigitalWaveguideStrategy
+from .utils import _dispersion_sos
+
+
+@lru_cache(maxsize=512)
+def _bridge_matrix(alpha:float, stiff_a:float, stages:int, chunk:int) -> np.ndarray:
+    """
+    Bridge path (damping lowpass -> dispersion sections) over one chunk as a single matrix.
+    Input  = [chunk samples, lowpass state, section states]
+    Output = [lowpass output, dispersion output, lowpass state, section states]
+    Built by pushing every basis vector through the same filters the strategy uses.
+    """
+    sos = _dispersion_sos(stiff_a, stages)
+    num_states = 2 * sos.shape[0]
+    width = chunk + 1 + num_states
+    basis = np.zeros((chunk, width))
+    basis[:, :chunk] = np.eye(chunk)
+
+    zi = np.zeros((1, width))
+    zi[0, chunk] = 1.0
+    lowpassed, lp_state = lfilter([1.0 - alpha], [1.0, -alpha], basis, axis=0, zi=zi)
+
+    sos_zi = np.zeros((sos.shape[0], 2, width))
+    sos_zi.reshape(num_states, width)[:, chunk + 1:] = np.eye(num_states)
+    dispersed, sos_zf = sosfilt(sos, lowpassed, axis=0, zi=sos_zi)
+    return np.vstack([lowpassed, dispersed, lp_state, sos_zf.reshape(num_states, width)])
+
+@lru_cache(maxsize=512)
+def _nut_matrix(c:float, chunk:int) -> np.ndarray:
+    """Fractional allpass at the nut. Input = [chunk samples, state], output = [samples, state]."""
+    basis = np.zeros((chunk, chunk + 1))
+    basis[:, :chunk] = np.eye(chunk)
+    zi = np.zeros((1, chunk + 1))
+    zi[0, chunk] = 1.0
+    reflected, zf = lfilter([c, 1.0], [1.0, c], basis, axis=0, zi=zi)
+    return np.vstack((reflected, zf))
+
+
+class WaveguideBank:
+    """
+    Structure-of-arrays renderer for a set of DigitalWaveguideStrategy strings.
+
+    Every string's rails live as a row of one 2-D array (the strategies keep views into it),
+    filter states are gathered into (strings, order) arrays at the start of a block and every
+    chunk advances all strings with one batched matrix product per reflection.
+    The strategies stay the source of truth for tuning, so set_frequency/excite work as before.
+
+    A bank is built once per set of strings (every voice), off the audio thread. Each block only
+    the rows of awake strings are gathered and advanced, sleeping rows are left untouched.
+    """
+    def __init__(self, strings:list[DigitalWaveguideStrategy]):
+        self.strings = strings
+        self.num_strings = len(strings)
+        self.stages = strings[0].stiffness.stages
+        self.num_states = 1 + strings[0].stiffness.zi.size
+        width = max(s.max_size for s in strings)
+        self.dtype = strings[0].dtype
+        self.right = np.zeros((self.num_strings, width), dtype=self.dtype)
+        self.left = np.zeros((self.num_strings, width), dtype=self.dtype)
+        self._right_rows = [None] * self.num_strings
+        self._left_rows = [None] * self.num_strings
+        self._awake = np.zeros(self.num_strings, dtype=bool)
+        self._matrix_key = None
+        self._matrices = {}
+        self._adopt_buffers()
+
+    @staticmethod
+    def supports(strings) -> bool:
+        return len(strings) > 0 and all(type(s) is DigitalWaveguideStrategy for s in strings) \
+            and len({s.stiffness.stages for s in strings}) == 1 and len({s.dtype for s in strings}) == 1
+
+    def _adopt_buffers(self):
+        """Points every string at its bank row, copying in any buffer it reallocated."""
+        for i, s in enumerate(self.strings):
+            if s.right_buffer is self._right_rows[i] and s.left_buffer is self._left_rows[i]:
+                continue
+            if len(s.right_buffer) > self.right.shape[1]:
+                grow = len(s.right_buffer) - self.right.shape[1]
+                self.right = np.pad(self.right, ((0, 0), (0, grow)))
+                self.left = np.pad(self.left, ((0, 0), (0, grow)))
+                self._right_rows = [None] * self.num_strings
+                self._left_rows = [None] * self.num_strings
+                return self._adopt_buffers()
+            self.right[i] = 0.0
+            self.left[i] = 0.0
+            self.right[i, :len(s.right_buffer)] = s.right_buffer
+            self.left[i, :len(s.left_buffer)] = s.left_buffer
+            self._right_rows[i] = s.right_buffer = self.right[i]
+            self._left_rows[i] = s.left_buffer = self.left[i]
+
+    def _stacked(self, strings:list, chunk:int):
+        """Per-string bridge/nut matrices for this chunk length, rebuilt only when the tuning of the awake strings moves."""
+        key = tuple((s.damping_filter.alpha, s.stiffness.a, s.frac_c) for s in strings)
+        if key != self._matrix_key:
+            self._matrix_key = key
+            self._matrices = {}
+        if chunk not in self._matrices:
+            # Designed in double precision, applied in the strings' precision
+            bridge = np.stack([_bridge_matrix(alpha, a, self.stages, chunk) for alpha, a, _ in key]).astype(self.dtype)
+            nut = np.stack([_nut_matrix(c, chunk) for _, _, c in key]).astype(self.dtype)
+            self._matrices[chunk] = (bridge, nut)
+        return self._matrices[chunk]
+
+    def process(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        """Renders num_samples of the summed strings, into out when given."""
+        self._adopt_buffers()
+        output = np.zeros(num_samples, dtype=self.dtype) if out is None else out
+        if num_samples <= 0:
+            return output
+        awake = self._awake
+        for i, s in enumerate(self.strings):
+            awake[i] = s.awake
+        if not awake.any():
+            output[:] = 0.0
+            return output
+        rows = np.flatnonzero(awake)[:, None]
+        strings = [self.strings[i] for i in rows[:, 0]]
+        num_strings = len(strings)
+
+        buff_sizes = np.array([s.buffer_size for s in strings])
+        ptrs = np.array([s.ptr for s in strings]) % buff_sizes
+        damping = np.array([s.current_damping for s in strings])[:, None]
+        use_bridge = np.array([bool(s.config.use_bridge_output) for s in strings])
+
+        # Filter states in lfilter's transposed form, one row per string
+        bridge_state = np.empty((num_strings, self.num_states), dtype=self.dtype)
+        nut_state = np.empty((num_strings, 1), dtype=self.dtype)
+        for i, s in enumerate(strings):
+            bridge_state[i, 0] = s.damping_filter.alpha * s.damping_filter.prev_output
+            bridge_state[i, 1:] = s.stiffness.zi.ravel()
+            nut_state[i, 0] = s.fractional_delay.x_prev - s.frac_c*s.fractional_delay.y_prev
+
+        # The shortest loop bounds the chunk: nothing written in a chunk is read back inside it
+        chunk_size = int(buff_sizes.min())
+        ramp = np.arange(min(chunk_size, num_samples))
+
+        any_pickups = not use_bridge.all()
+        if any_pickups:
+            pickup_offsets = np.stack([s.get_pickup_offsets() for s in strings])
+            num_pickups = pickup_offsets.shape[1]
+            pickup_ramp = ramp[None, :, None] + pickup_offsets[:, None, :]
+            pickup_fresh = (pickup_ramp >= buff_sizes[:, None, None]) | (pickup_offsets[:, None, :] == 0)
+            pickup_rows = rows[:, :, None]
+
+        processed = 0
+        while processed < num_samples:
+            current_chunk = min(chunk_size, num_samples - processed)
+            bridge_matrix, nut_matrix = self._stacked(strings, current_chunk)
+
+            indices = ramp[:current_chunk] + ptrs[:, None]
+            indices %= buff_sizes[:, None]
+            val_bridge = self.right[rows, indices]
+            val_nut = self.left[rows, indices]
+
+            bridge_out = np.matmul(bridge_matrix, np.concatenate((val_bridge, bridge_state), axis=1)[:, :, None])[:, :, 0]
+            filtered_bridge = bridge_out[:, :current_chunk]
+            stiff_bridge = bridge_out[:, current_chunk:2*current_chunk]
+            bridge_state = bridge_out[:, 2*current_chunk:]
+
+            nut_out = np.matmul(nut_matrix, np.concatenate((-val_nut, nut_state), axis=1)[:, :, None])[:, :, 0]
+            nut_reflection = nut_out[:, :current_chunk]
+            nut_state = nut_out[:, current_chunk:]
+
+            if any_pickups:
+                pickup_idx = pickup_ramp[:, :current_chunk] + ptrs[:, None, None]
+                pickup_idx %= buff_sizes[:, None, None]
+                before = self.right[pickup_rows, pickup_idx] + self.left[pickup_rows, pickup_idx]
+
+            self.left[rows, indices] = -stiff_bridge * damping
+            self.right[rows, indices] = nut_reflection
+
+            if any_pickups:
+                after = self.right[pickup_rows, pickup_idx] + self.left[pickup_rows, pickup_idx]
+                picked = np.where(pickup_fresh[:, :current_chunk], after, before).sum(axis=2) / num_pickups
+                per_string = np.where(use_bridge[:, None], filtered_bridge, picked)
+            else:
+                per_string = filtered_bridge
+            output[processed:processed + current_chunk] = per_string.sum(axis=0)
+
+            ptrs = (ptrs + current_chunk) % buff_sizes
+            processed += current_chunk
+
+        # Hand the state back to the strategies
+        for i, s in enumerate(strings):
+            s.ptr = int(ptrs[i])
+            s.damping_filter.prev_output = filtered_bridge[i, -1]
+            s.stiffness.zi = bridge_state[i, 1:].reshape(-1, 2).copy()
+            s.fractional_delay.x_prev = -val_nut[i, -1]
+            s.fractional_delay.y_prev = nut_reflection[i, -1]
+        return output
@@ -0,0 +1,61 @@
+"""
+Per-note tuning tables.
+
+set_frequency derives the loop length, fractional allpass coefficient, damping and
+dispersion from (frequency, sustain). For every MIDI note those only depend on the
+engine, sample rate, sustain and instrument config, so they are computed once per
+combination and set_frequency becomes a lookup. Frequencies that are not exactly on a
+MIDI note (e.g. the frequency slider) are still computed directly.
+
+Building a table (128 dispersion fits) is far too slow for the audio thread. Control threads
+build it ahead with get_tuning_table(strategy, sustain, stiffness) and hand it over, the audio
+thread passes it to set_frequency(..., table=table).
+"""
+from collections import OrderedDict
+import math
+from .core import midi_to_freq
+
+MIDI_NOTES = 128
+MAX_TABLES = 64
+
+_TABLES: OrderedDict = OrderedDict()
+# note_to_freq goes through midi_to_freq, so note frequencies hit this exactly
+_MIDI_BY_FREQ = {midi_to_freq(n): n for n in range(MIDI_NOTES)}
+
+def freq_to_midi(frequency:float):
+    """MIDI note number if frequency sits exactly on one, otherwise None."""
+    n = _MIDI_BY_FREQ.get(frequency)
+    if n is None and frequency > 0.0:
+        # Tolerate frequencies that went through a float round trip
+        m = 69.0 + 12.0 * math.log2(frequency / 440.0)
+        if 0 <= round(m) < MIDI_NOTES and abs(m - round(m)) < 1e-9:
+            n = round(m)
+    return n
+
+def get_tuning_table(strategy, sustain_time:float, stiffness:float = None) -> list:
+    """
+    Table for this strategy's (engine, sample rate, config, sustain), built on first use.
+    Keys are parameter values, so a table only goes stale when a parameter actually changes.
+    stiffness overrides the config's, for a table the strings will only use once it is applied.
+    """
+    key = strategy.tuning_key(sustain_time, stiffness)
+    table = _TABLES.get(key)
+    if table is None:
+        table = [strategy.compute_tuning(midi_to_freq(n), sustain_time, stiffness) for n in range(MIDI_NOTES)]
+        _TABLES[key] = table
+        if len(_TABLES) > MAX_TABLES:
+            _TABLES.popitem(last=False)
+    else:
+        _TABLES.move_to_end(key)
+    return table
+
+def lookup(strategy, frequency:float, sustain_time:float, table:list = None) -> tuple:
+    n = freq_to_midi(frequency)
+    if n is None:
+        return strategy.compute_tuning(frequency, sustain_time)
+    if table is None:
+        table = get_tuning_table(strategy, sustain_time)
+    return table[n]
+
+def clear_tuning_tables():
+    _TABLES.clear()
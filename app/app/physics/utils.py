@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.signal import lfilter
+from scipy.signal import lfilter, sosfilt
+from functools import lru_cache
 
 class FractionalDelay:
     #Adding logic for all-pass filter
@@ -18,9 +19,10 @@ class FractionalDelay:
         return output
 
     def process_vector(self, signal:np.ndarray, c:float)->np.ndarray:
-        b = [c,1.0]
-        a = [1.0,c]
-        zi = np.array([self.x_prev - c*self.y_prev])
+        # Coefficients in the signal's precision so float32 strings stay float32
+        b = np.array([c,1.0], dtype=signal.dtype)
+        a = np.array([1.0,c], dtype=signal.dtype)
+        zi = np.array([self.x_prev - c*self.y_prev], dtype=signal.dtype)
 
         output, zf = lfilter(b,a,signal,zi=zi)
 
@@ -52,10 +54,10 @@ class LowPassFilter:
         return output
 
     def process_vector(self, signal:np.ndarray) -> np.ndarray:
-        b = [1.0 - self.alpha]
-        a = [1.0 - self.alpha]
+        b = np.array([1.0 - self.alpha], dtype=signal.dtype)
+        a = np.array([1.0, -self.alpha], dtype=signal.dtype)
 
-        zi = np.array(self.prev_output *self.alpha)
+        zi = np.array([self.prev_output *self.alpha], dtype=signal.dtype)
 
         output, zf = lfilter(b,a, signal, zi=zi)
 
@@ -65,30 +67,55 @@ class LowPassFilter:
     def reset(self):
         self.prev_output = 0.0
         
+@lru_cache(maxsize=256)
+def _dispersion_sos(a:float, stages:int, dtype=np.float64) -> np.ndarray:
+    """
+    The cascade of identical first-order allpasses (a + z^-1)/(1 + a*z^-1) folded pairwise
+    into second-order sections, so the whole chain runs in one sosfilt call.
+    Kept as sections: expanding to one polynomial would put a stages-fold repeated pole
+    into direct form, which is numerically fragile.
+    """
+    pair = [a*a, 2.0*a, 1.0, 1.0, 2.0*a, a*a]
+    sos = [pair] * (stages // 2)
+    if stages % 2:
+        sos.append([a, 1.0, 0.0, 1.0, a, 0.0])
+    # Shared between every string with this stiffness, never modify in place
+    return np.array(sos, dtype=dtype).reshape(-1, 6)
+
+@lru_cache(maxsize=1024)
+def _fit_stiffness(target_stiffness:float, stages:int, max_delay_budget:float) -> tuple[float, float]:
+    """Coefficient and group delay for a stiffness target that fits the string's delay budget."""
+    s = max(-0.99, min(0.99, target_stiffness))
+    delay = stages * (1.0-s) / (1.0+s)
+    if delay> max_delay_budget:
+        D = max(0.1,max_delay_budget)
+        s = (stages-D) / (stages+D)
+        delay = D
+    return s, delay
+
 class StiffnessDispersion:
-    def __init__(self, stiffness:float = -0.7, stages:int = 12):
-        self.a = stiffness
+    def __init__(self, stiffness:float = -0.7, stages:int = 12, dtype=np.float64):
         self.stages = stages
+        self.dtype = dtype
+        self.a = stiffness
         self.x_prev = [0.0]*stages
         self.y_prev = [0.0]*stages
-        self.zi_vec = [np.zeros(1) for _ in range(stages)]
-    
-    def process_vector(self, signal: np.ndarray) -> np.ndarray:
-        current = signal
-        b = np.array([self.a, 1.0])
-        a_poly = np.array([1.0, self.a])
+        self.zi = np.zeros((self.sos.shape[0], 2), dtype=dtype)
 
-        for i in range(self.stages):
-            output, self.zi_vec[i] = lfilter(b,a_poly,current, zi =self.zi_vec[i])
-            current = output
+    @property
+    def a(self) -> float:
+        return self._a
 
-        return current
+    @a.setter
+    def a(self, value:float):
+        # Anything assigning the coefficient (e.g. the stiffness slider) gets matching sections
+        self._a = value
+        self.sos = _dispersion_sos(value, self.stages, self.dtype)
+
+    def process_vector(self, signal: np.ndarray) -> np.ndarray:
+        output, self.zi = sosfilt(self.sos, signal, zi=self.zi)
+        return output
 
-    def reset(self):
-        self.x_prev = [0.0]*self.stages
-        self.y_prev = [0.0]*self.stages
-        self.zi_vec = [np.zeros(1) for _ in range(self.stages)]
-        
     def get_group_delay(self) -> float:
         """Calculates the total sample delay introduced by all stages."""
         denom = (1.0+self.a)
@@ -96,12 +123,9 @@ class StiffnessDispersion:
         return self.stages*(1.0-self.a)/denom
     
     def update_stiffness(self, target_stiffness:float, max_delay_budget:float):
-        s = max(-0.99, min(0.99, target_stiffness))
-        delay = self.stages * (1.0-s) / (1.0+s)
-        if delay> max_delay_budget:
-            D = max(0.1,max_delay_budget)
-            s = (self.stages-D) / (self.stages+D)
-            delay = D
+        # max_delay_budget is derived from the fundamental, so this is memoized per
+        # (stiffness, stages, fundamental) and slider drags reuse earlier designs
+        s, delay = _fit_stiffness(target_stiffness, self.stages, max_delay_budget)
         self.a=s
         return delay
 
@@ -117,3 +141,4 @@ class StiffnessDispersion:
     def reset(self):
         self.x_prev = [0.0]*self.stages
         self.y_prev = [0.0]*self.stages
+        self.zi = np.zeros((self.sos.shape[0], 2), dtype=self.dtype)
@@ -0,0 +1,80 @@
+import threading
+import time
+import numpy as np
+
+
+class RenderAhead:
+    """
+    Renders on a producer thread into a ring buffer, `ahead_ms` ahead of the device.
+
+    The callback only copies out of the ring, so a long GIL hold elsewhere (a web request, a
+    slider handler) eats into the buffered audio instead of the block deadline. The ring is
+    single-producer/single-consumer like CommandQueue: `written` is only advanced by the
+    producer and `read` only by the callback, both as absolute sample counts, so neither side
+    locks. The capacity is a whole number of render blocks, so a block never wraps.
+
+    Events still go through the scheduler inside `render`, whose clock is the render head:
+    they stay sample-accurate against each other and sound ahead_ms after they are applied.
+    """
+    def __init__(self, render, sample_rate:int = 44100, ahead_ms:float = 50.0, block_size:int = 256,
+                 channels:int = 2, dtype=np.float32, on_block = None):
+        self.render = render           # render(num_samples, out=...) writes a block in place
+        self.fs = sample_rate
+        self.block_size = block_size
+        self.ahead = max(block_size, int(ahead_ms * sample_rate / 1000))
+        num_blocks = -(-self.ahead // block_size) + 1
+        self.capacity = num_blocks * block_size
+        self.ring = np.zeros((self.capacity, channels), dtype=dtype)
+        self.on_block = on_block       # on_block(num_samples, elapsed) after every render, e.g. a monitor
+        self.written = 0
+        self.read = 0
+        self.underruns = 0             # callbacks that found less audio than they needed
+        self._stop = threading.Event()
+        self._thread = None
+
+    def fill(self):
+        """Renders until ahead_ms of audio is buffered."""
+        while self.written - self.read < self.ahead:
+            start = self.written % self.capacity
+            began = time.perf_counter()
+            self.render(self.block_size, out=self.ring[start:start + self.block_size])
+            if self.on_block is not None:
+                self.on_block(self.block_size, time.perf_counter() - began)
+            # Published only once the block is complete
+            self.written += self.block_size
+
+    def _produce(self):
+        # Polls at a quarter block, the callback never signals (that would take a lock)
+        interval = self.block_size / self.fs / 4
+        while not self._stop.is_set():
+            self.fill()
+            self._stop.wait(interval)
+
+    def start(self):
+        if self._thread is None:
+            self.fill()
+            self._thread = threading.Thread(target=self._produce, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def latency(self) -> float:
+        """Seconds between a block being rendered and heard, on top of the device's own latency."""
+        return self.ahead / self.fs
+
+    def pull(self, frames:int, out:np.ndarray) -> np.ndarray:
+        """Audio callback side: copies the next frames into out, silence for whatever is missing."""
+        available = min(frames, self.written - self.read)
+        start = self.read % self.capacity
+        first = min(available, self.capacity - start)
+        out[:first] = self.ring[start:start + first]
+        out[first:available] = self.ring[:available - first]
+        if available < frames:
+            out[available:] = 0.0
+            self.underruns += 1
+        self.read += available
+        return out
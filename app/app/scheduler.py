@@ -0,0 +1,78 @@
+import heapq
+import itertools
+import numpy as np
+from .command_queue import CommandQueue
+
+SCHEDULE = 0
+
+
+class EventScheduler:
+    """
+    Sample-accurate event timing inside the render loop.
+
+    Events are (offset_samples, opcode, arg0, arg1, arg2) tuples. They arrive from control
+    threads through a CommandQueue and wait in a heap keyed by absolute sample time. Their heap
+    entries are built by post, on the posting thread, the audio thread only rebases them and
+    links them into the heap. process_block
+    splits the block at every event time, so e.g. a strum keeps its exact string spacing whatever
+    the callback blocksize is.
+    """
+    def __init__(self, render, handler, sample_rate:int = 44100, capacity:int = 1024):
+        self.render = render      # render(num_samples, out=None) -> (num_samples, channels)
+        self.handler = handler    # handler(opcode, arg0, arg1, arg2), runs on the audio thread
+        self.sample_rate = sample_rate
+        self.inbox = CommandQueue(capacity)
+        self.clock = 0            # Absolute sample index of the next sample to render
+        self._pending = []
+        self._seq = itertools.count() # Keeps same-sample events in posting order
+
+    def to_samples(self, seconds:float) -> int:
+        return int(round(seconds * self.sample_rate))
+
+    def post(self, events, at:int = None) -> bool:
+        """
+        Queues events from any thread. Offsets count from the absolute sample `at`, or from the
+        start of the block that picks them up when at is None. A list posted together is
+        anchored together, so its relative timing is exact.
+        """
+        entries = [[offset, next(self._seq), opcode, arg0, arg1, arg2] for offset, opcode, arg0, arg1, arg2 in events]
+        return self.inbox.push(SCHEDULE, at, entries)
+
+    def _receive(self, opcode, at, entries, _):
+        base = self.clock if at is None else at
+        for entry in entries:
+            entry[0] += base
+            heapq.heappush(self._pending, entry)
+
+    def _apply_due(self):
+        pending = self._pending
+        # Late events (time already passed) play at the start of this block
+        while pending and pending[0][0] <= self.clock:
+            _, _, opcode, arg0, arg1, arg2 = heapq.heappop(pending)
+            self.handler(opcode, arg0, arg1, arg2)
+
+    def clear(self):
+        self._pending.clear()
+
+    def process_block(self, num_samples:int, out:np.ndarray = None) -> np.ndarray:
+        """Renders num_samples, into out when given."""
+        self.inbox.drain(self._receive)
+        self._apply_due()
+        start = self.clock
+        end = start + num_samples
+        pending = self._pending
+        if not pending or pending[0][0] >= end:
+            self.clock = end
+            return self.render(num_samples, out=out)
+
+        # Render up to each event, apply it, carry on
+        pieces = []
+        while self.clock < end:
+            stop = min(pending[0][0], end) if pending else end
+            if out is None:
+                pieces.append(self.render(stop - self.clock))
+            else:
+                self.render(stop - self.clock, out=out[self.clock - start:stop - start])
+            self.clock = stop
+            self._apply_due()
+        return out if out is not None else np.concatenate(pieces)
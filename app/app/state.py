@@ -1,7 +1,18 @@
+import asyncio
 import reflex as rx
 from .audio_manager import audio_manager
 from .physics.core import note_to_freq
 
+def _connected(token:str) -> bool:
+    """Whether the client with this token still has a websocket open."""
+    from .app import app
+    namespace = app.event_namespace
+    return namespace is None or token in namespace.token_to_sid
+
+# The reaper closes the sessions of clients that went away without closing them
+audio_manager.client_alive = _connected
+
+
 class State(rx.State):
     """The app state."""
     # Physics Parameters
@@ -16,28 +27,91 @@ class State(rx.State):
     last_generated_freq: float = 0.0
 
     synthesis_mode = "Digital Waveguide"
+    volume: float = 1.0
+
+    # Engine monitor
+    cpu_load: float = 0.0
+    cpu_peak: float = 0.0
+    xruns: int = 0
+    sessions: str = "0/0"
+    # Whether this client's monitor_engine loop runs (backend only)
+    _monitoring: bool = False
 
     def on_load(self):
         print("App started, initializing audio")
         audio_manager.initialize()
 
+    def on_unload(self):
+        """The page unmounted: stop the monitor and give the session's budget back."""
+        self._monitoring = False
+        audio_manager.close_session(self.router.session.client_token)
+
+    def _session(self):
+        """This client's own instrument in the shared mixer, None when the mixer is full."""
+        session = audio_manager.session(self.router.session.client_token)
+        if session is not None and not session.configured:
+            # New, or opened again after the mixer evicted it: make it sound like the controls show
+            session.configured = True
+            session.set_synthesis_mode(self.synthesis_mode)
+            session.set_frequency(self.frequency)
+            session.set_sustain(self.sustain)
+            session.set_stiffness(self.stiffness)
+            session.set_gain(self.volume)
+        return session
+
+    @rx.event(background=True)
+    async def monitor_engine(self):
+        """
+        Polls the callback stats for the live CPU/xrun readout, one loop per client, until the
+        page unmounts or the client's socket goes away (which also closes its session).
+        """
+        async with self:
+            if self._monitoring:
+                return
+            self._monitoring = True
+            token = self.router.session.client_token
+        while _connected(token):
+            stats = audio_manager.get_performance_stats()
+            async with self:
+                if not self._monitoring:
+                    return
+                if stats:
+                    self.cpu_load = round(stats["load_mean"]*100, 1)
+                    self.cpu_peak = round(stats["load_p99"]*100, 1)
+                    self.xruns = stats["xruns"]
+                    self.sessions = f"{stats['sessions']}/{stats['session_capacity']}"
+            await asyncio.sleep(0.5)
+        # Tab closed or connection lost, no unmount event comes
+        audio_manager.close_session(token)
+        async with self:
+            self._monitoring = False
+
     # --- Setters ---
     def update_freq(self, value: list[float]):
         self.frequency = value[0]
-        audio_manager.set_frequency(self.frequency)
+        if session := self._session():
+            session.set_frequency(self.frequency)
 
     def update_sustain(self, value: list[float]):
         self.sustain = value[0]
-        audio_manager.set_sustain(self.sustain)
+        if session := self._session():
+            session.set_sustain(self.sustain)
         
     def update_stiffness(self, value: list[float]):
         self.stiffness = value[0]
-        audio_manager.set_stiffness(self.stiffness)
+        if session := self._session():
+            session.set_stiffness(self.stiffness)
         print(f"Stiffness updated to {self.stiffness}")
 
     def update_synthesis_mode(self, mode:str):
         self.synthesis_mode = mode
-        audio_manager.set_synthesis_mode(mode)
+        if session := self._session():
+            session.set_synthesis_mode(mode)
+
+    def update_volume(self, value: list[float]):
+        self.volume = value[0]
+        if session := self._session():
+            session.set_gain(self.volume)
 
     def play_chord(self, chord_name: str):
         chords = {
@@ -50,40 +124,40 @@ class State(rx.State):
         if chord_name in chords:
             notes = chords[chord_name]
             freqs = [note_to_freq(n) for n in notes]
-            audio_manager.strum(freqs)
+            if session := self._session():
+                session.strum(freqs)
 
     def play_note(self, note_name: str):
         freq = note_to_freq(note_name)
         self.last_target_freq = freq
-        audio_manager.strum([freq])
-        self.last_generated_freq = audio_manager.get_effective_frequency()
+        if session := self._session():
+            session.strum([freq])
+            self.last_generated_freq = session.get_effective_frequency()
 
     def play_song(self):
-        def _song_thread():
-            import time
-            from .physics.core import note_to_freq
-            
-            chords = {
-                "Am_low": ["A2", "E3"],
-                "Am_full": ["A3", "C4", "E4"],
-                "C_low": ["C3", "E3"],
-                "C_full": ["G3", "C4", "E4"],
-                "D_low": ["D3", "A3"],
-                "D_full": ["D4", "F#4"],
-            }
-            
-            loop = ["Am", "C", "D", "Am"]
-            
-            for chord in loop:
-                low = chords[f"{chord}_low"]
-                full = chords[f"{chord}_full"]
-                
-                for note in low:
-                    audio_manager.strum([note_to_freq(note)], duration=0.0)
-                    time.sleep(0.3)
-                
-                audio_manager.strum([note_to_freq(n) for n in full], duration=0.1, direction='down')
-                time.sleep(1)
-        
-        import threading
-        threading.Thread(target=_song_thread, daemon=True).start()
\ No newline at end of file
+        chords = {
+            "Am_low": ["A2", "E3"],
+            "Am_full": ["A3", "C4", "E4"],
+            "C_low": ["C3", "E3"],
+            "C_full": ["G3", "C4", "E4"],
+            "D_low": ["D3", "A3"],
+            "D_full": ["D4", "F#4"],
+        }
+
+        loop = ["Am", "C", "D", "Am"]
+
+        # The whole song is scheduled up front, the audio thread times it to the sample
+        strums = []
+        t = 0.0
+        for chord in loop:
+            low = chords[f"{chord}_low"]
+            full = chords[f"{chord}_full"]
+
+            for note in low:
+                strums.append((t, [note_to_freq(note)], 0.0, 'down'))
+                t += 0.3
+
+            strums.append((t, [note_to_freq(n) for n in full], 0.1, 'down'))
+            t += 1
+        if session := self._session():
+            session.play_sequence(strums)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+import scipy
+from app.app.physics import kernels
+from app.app.physics.core import InstrumentConfig, midi_to_freq
+from app.app.physics.tuning import freq_to_midi
+from app.app.physics.karplus_strong import KarplusStrongAlgorithm
+from app.app.physics.dwg import DigitalWaveguideStrategy
+from app.app.physics.utils import StiffnessDispersion, FractionalDelay, LowPassFilter
+from app.app.physics.body import GuitarBody, StereoGuitarBody, ConvolutionBody
+from app.app.instruments.acoustic_guitar import AcousticGuitar
+
+class DSPBenchmark:
+    """
+    Samples/sec and realtime factor for every DSP stage, swept over block size, pitch and
+    polyphony. Each case renders at least `seconds` of audio and keeps the best of `repeats`.
+    Strings are swept over MIDI `pitches`, by default every note from E2 (40) to E6 (88): loop
+    length picks the render path (period chunks or matrix jumps), so cost is not monotonic in pitch.
+    """
+    def __init__(self, block_sizes=(64, 128, 256, 512, 1024, 2048, 4096), pitches=None,
+                 polyphony=(1, 2, 3, 4, 5, 6), seconds=0.5, repeats=3):
+        self.fs = 44100
+        self.block_sizes = block_sizes
+        self.pitches = pitches or range(40, 89)
+        self.polyphony = polyphony
+        self.num_samples = int(seconds*self.fs)
+        self.repeats = repeats
+        self.results = {}
+
+    def _measure(self, key:str, setup, render, block_size:int):
+        """setup() -> state, render(state, block_size) renders one block."""
+        num_blocks = max(1, self.num_samples // block_size)
+        best = float("inf")
+        for _ in range(self.repeats):
+            state = setup()
+            start = time.perf_counter()
+            for _ in range(num_blocks):
+                render(state, block_size)
+            best = min(best, time.perf_counter() - start)
+        samples_per_sec = num_blocks*block_size / best
+        self.results[key] = {"samples_per_sec": samples_per_sec, "realtime_factor": samples_per_sec / self.fs}
+        print(f"{key:<62}{samples_per_sec:>14.0f}{samples_per_sec / self.fs:>10.1f}x")
+
+    def bench_strings(self):
+        engines = {"KarplusStrongAlgorithm": KarplusStrongAlgorithm, "DigitalWaveguideStrategy": DigitalWaveguideStrategy}
+        for backend in kernels.available_backends():
+            kernels.set_backend(backend)
+            kernels.get_backend().warm_up()
+            for name, cls in engines.items():
+                for midi in self.pitches:
+                    freq = midi_to_freq(midi)
+                    def setup(cls=cls, freq=freq):
+                        np.random.seed(0)
+                        string = cls(sample_rate=self.fs, frequency=freq)
+                        string.excite(1.0)
+                        return string
+                    for block_size in self.block_sizes:
+                        self._measure(f"{name}/{backend}/midi={midi}/block={block_size}", setup,
+                                      lambda s, n: s.process(n), block_size)
+                for block_size in self.block_sizes:
+                    cases = {midi: self.results[f"{name}/{backend}/midi={midi}/block={block_size}"]["realtime_factor"]
+                             for midi in self.pitches}
+                    slowest = min(cases, key=cases.get)
+                    print(f"  slowest pitch for {name}/{backend}/block={block_size}: midi={slowest} ({cases[slowest]:.1f}x)")
+
+    def bench_filters(self):
+        signal = np.random.default_rng(0).uniform(-1, 1, max(self.block_sizes))
+        # Synthetic 1s decaying noise impulse response, partitioned at 512 samples
+        impulse_response = np.random.default_rng(1).standard_normal(self.fs) * np.exp(-np.arange(self.fs) / (0.2*self.fs))
+        filters = {
+            "StiffnessDispersion": (StiffnessDispersion, lambda f, n: f.process_vector(signal[:n])),
+            "FractionalDelay": (FractionalDelay, lambda f, n: f.process_vector(signal[:n], 0.3)),
+            "LowPassFilter": (lambda: LowPassFilter(0.2), lambda f, n: f.process_vector(signal[:n])),
+            "GuitarBody": (lambda: GuitarBody(sample_rate=self.fs, resonance_freq=95.0), lambda f, n: f.process(signal[:n])),
+            "StereoGuitarBody/tanh": (lambda: StereoGuitarBody(sample_rate=self.fs), lambda f, n: f.process(signal[:n])),
+            "StereoGuitarBody/soft": (lambda: StereoGuitarBody(sample_rate=self.fs, saturation="soft"), lambda f, n: f.process(signal[:n])),
+            "ConvolutionBody/ir=1s": (lambda: ConvolutionBody(impulse_response, sample_rate=self.fs), lambda f, n: f.process(signal[:n])),
+        }
+        for name, (setup, render) in filters.items():
+            for block_size in self.block_sizes:
+                self._measure(f"{name}/block={block_size}", setup, render, block_size)
+
+    def bench_guitar(self):
+        for backend in kernels.available_backends():
+            kernels.set_backend(backend)
+            for engine in ("Digital Waveguide", "Karplus Strong"):
+                for voices in self.polyphony:
+                    def setup(engine=engine, voices=voices):
+                        np.random.seed(0)
+                        guitar = AcousticGuitar()
+                        guitar.set_synthesis_strategy(engine)
+                        for freq in guitar.open_frequencies[:voices]:
+                            guitar.play(freq, 1.0)
+                        return guitar
+                    for block_size in self.block_sizes:
+                        self._measure(f"AcousticGuitar/{engine}/{backend}/voices={voices}/block={block_size}",
+                                      setup, lambda g, n: g.process_block(n), block_size)
+
+    def run(self, components=("strings", "filters", "guitar")) -> dict:
+        previous = kernels.get_backend().name
+        print(f"{'case':<62}{'samples/s':>14}{'realtime':>11}")
+        try:
+            for component in components:
+                getattr(self, f"bench_{component}")()
+        finally:
+            kernels.set_backend(previous)
+        return self.results
+
+    def to_json(self) -> dict:
+        return {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "scipy": scipy.__version__,
+                "backends": kernels.available_backends(),
+                "sample_rate": self.fs,
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": self.results,
+        }
+
+def compare(baseline:dict, current:dict, threshold:float) -> list[str]:
+    """Cases whose samples/sec dropped by more than threshold (a fraction) against the baseline."""
+    regressions = []
+    for key, base in baseline["results"].items():
+        if key not in current["results"]:
+            continue
+        ratio = current["results"][key]["samples_per_sec"] / base["samples_per_sec"]
+        if ratio < 1.0 - threshold:
+            regressions.append(f"{key}: {ratio:.2f}x of baseline")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DSP components.")
+    parser.add_argument("--save", help="Write the results to this JSON baseline")
+    parser.add_argument("--compare", help="Compare against this JSON baseline, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before flagging (0.15 = 15%%)")
+    parser.add_argument("--only", nargs="*", default=["strings", "filters", "guitar"],
+                        choices=["strings", "filters", "guitar"])
+    parser.add_argument("--quick", action="store_true", help="Fewer block sizes and voices, one pitch per string, shorter renders")
+    args = parser.parse_args()
+
+    if args.quick:
+        # One pitch per string: the guitar's open strings
+        pitches = [freq_to_midi(freq) for freq in AcousticGuitar().open_frequencies]
+        bench = DSPBenchmark(block_sizes=(64, 512, 4096), pitches=pitches, polyphony=(1, 6), seconds=0.2, repeats=2)
+    else:
+        bench = DSPBenchmark()
+    bench.run(args.only)
+    current = bench.to_json()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved {len(bench.results)} cases to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"--- {len(regressions)} regressions beyond {args.threshold:.0%} ---")
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import time
+import numpy as np
+from app.app.physics.core import note_to_freq
+from app.app.physics.karplus_strong import KarplusStrongAlgorithm
+from app.app.physics.dwg import DigitalWaveguideStrategy
+from app.app.instruments.acoustic_guitar import AcousticGuitar
+
+class NoteOnBenchmark:
+    """Measures note-on latency (set_frequency + excite) in microseconds per engine."""
+    def __init__(self, notes=("C2", "E2", "A2", "D3", "G3", "B3", "E4", "A4", "E5", "E6"), repeats=200):
+        self.fs = 44100
+        self.notes = notes
+        self.repeats = repeats
+
+    def _time_note_ons(self, note_on) -> np.ndarray:
+        timings = []
+        for i in range(self.repeats):
+            note = self.notes[i % len(self.notes)]
+            velocity = 0.6 + 0.4 * ((i * 7) % 10) / 10.0 # spread velocities, shapes are velocity-independent
+            start = time.perf_counter()
+            note_on(note_to_freq(note), velocity)
+            timings.append(time.perf_counter() - start)
+        return np.array(timings) * 1e6
+
+    def _engines(self):
+        def strategy_note_on(cls):
+            string = cls(sample_rate=self.fs, frequency=82.41)
+            def note_on(freq, velocity):
+                string.set_frequency(freq)
+                string.excite(velocity)
+            return note_on
+
+        yield "Karplus Strong", strategy_note_on(KarplusStrongAlgorithm)
+        yield "Digital Waveguide", strategy_note_on(DigitalWaveguideStrategy)
+        guitar = AcousticGuitar()
+        yield "AcousticGuitar.play", lambda freq, velocity: guitar.play(freq, velocity)
+        pooled = AcousticGuitar(voices=16, polyphony=12)
+        yield "play (16 voice pool)", lambda freq, velocity: pooled.play(freq, velocity)
+
+    def run(self):
+        print(f"--- Note-on latency ({self.repeats} plucks over {len(self.notes)} notes) ---")
+        print(f"{'engine':<22}{'first pass':>12}{'mean':>10}{'p50':>10}{'p99':>10}  (us)")
+        results = {}
+        for label, note_on in self._engines():
+            timings = self._time_note_ons(note_on)
+            # The first pass over the notes fills the shape caches, the rest are cache hits
+            cold = timings[:len(self.notes)].mean()
+            warm = timings[len(self.notes):]
+            results[label] = {"cold_us": cold, "mean_us": warm.mean(),
+                              "p50_us": np.percentile(warm, 50), "p99_us": np.percentile(warm, 99)}
+            print(f"{label:<22}{cold:>12.1f}{warm.mean():>10.1f}{np.percentile(warm, 50):>10.1f}{np.percentile(warm, 99):>10.1f}")
+        return results
+
+if __name__ == "__main__":
+    NoteOnBenchmark().run()
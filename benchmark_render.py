@@ -0,0 +1,59 @@
+import argparse
+import os
+import tempfile
+import numpy as np
+from app.app.offline import OfflineRenderer
+from app.app.parallel import ParallelRenderer
+from play_demo import GuitarSequencer
+
+
+class RenderBenchmark:
+    """Offline render speed of the demo playlist: single process against the voice split per worker count."""
+    def __init__(self, passes:int = 1, workers=None, strategy:str = None, duration:float = None, seed:int = 0):
+        self.passes = passes
+        self.workers = workers or sorted({2, 3, os.cpu_count() or 1, 6} - {1})
+        self.strategy = strategy
+        self.duration = duration
+        self.seed = seed
+
+    def _events(self) -> list:
+        np.random.seed(self.seed)
+        sequencer = GuitarSequencer()
+        for _ in range(self.passes):
+            sequencer.queue_playlist()
+        return sequencer.events
+
+    def run(self) -> dict:
+        events = self._events()
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "render.wav")
+            # Kernel compilation/loading and the tuning caches are paid here, not by the first mode
+            OfflineRenderer().render(events[:20], path, duration=2.0)
+            single = ParallelRenderer(workers=1, strategy=self.strategy, seed=self.seed)
+            results["single"] = single.render_voices(events, path, duration=self.duration)
+            for workers in self.workers:
+                renderer = ParallelRenderer(workers=workers, strategy=self.strategy, seed=self.seed)
+                # The split path itself, even where render_voices would fall back to one process
+                results[workers] = renderer.render_voices_split(events, path, duration=self.duration)
+
+        base = results["single"]["realtime_factor"]
+        print(f"--- Offline render, {self.passes} playlist pass(es), {os.cpu_count()} CPU(s) ---")
+        print(f"{'mode':<18}{'realtime':>10}{'speedup':>10}")
+        print(f"{'single process':<18}{base:>9.1f}x{1.0:>9.2f}x")
+        for workers in self.workers:
+            factor = results[workers]["realtime_factor"]
+            print(f"{f'{workers} workers':<18}{factor:>9.1f}x{factor / base:>9.2f}x")
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Speedup of the parallel voice render over the single-process render.")
+    parser.add_argument("--passes", type=int, default=1, help="Playlist passes to render")
+    parser.add_argument("--workers", type=int, nargs="*", default=None, help="Worker counts to measure")
+    parser.add_argument("--engine", default=None, choices=["Digital Waveguide", "Karplus Strong"])
+    parser.add_argument("--duration", type=float, default=None, help="Fixed length in seconds")
+    args = parser.parse_args()
+    RenderBenchmark(args.passes, args.workers, args.engine, args.duration).run()
+
+if __name__ == "__main__":
+    main()
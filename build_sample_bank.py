@@ -0,0 +1,29 @@
+import argparse
+import time
+import numpy as np
+from app.app.instruments.sample_bank import build_sample_bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render the fretboard into a sample bank (SOUND_GEN_SAMPLE_BANK).")
+    parser.add_argument("output", help="Bank file to write")
+    parser.add_argument("--engine", default="Digital Waveguide", choices=["Digital Waveguide", "Karplus Strong"])
+    parser.add_argument("--layers", type=int, default=4, help="Velocity layers (1/n .. n/n)")
+    parser.add_argument("--frets", type=int, default=19, help="Frets rendered on every string")
+    parser.add_argument("--sustain", type=float, default=4.0, help="Sustain in seconds, as sessions play it")
+    parser.add_argument("--stiffness", type=float, default=None, help="String stiffness (default: the preset's)")
+    parser.add_argument("--precision", default="float64", help="Precision the engine runs at (SOUND_GEN_PRECISION)")
+    parser.add_argument("--tail-db", type=float, default=-96.0, help="Level at which a note's tail is cut")
+    parser.add_argument("--workers", type=int, default=0, help="Render processes (0 = one per core)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the excitation noise")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    info = build_sample_bank(args.output, engine=args.engine, velocity_layers=args.layers, frets=args.frets,
+                             sustain_time=args.sustain, stiffness=args.stiffness, dtype=np.dtype(args.precision).type,
+                             silence_threshold_db=args.tail_db, workers=args.workers or None, seed=args.seed)
+    print(f"{info['entries']} samples ({info['notes']} notes x {args.layers} layers), "
+          f"{info['bytes']/2**20:.1f} MB in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
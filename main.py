@@ -1,24 +1,23 @@
 import sounddevice as sd
-import numpy as np 
-from app.app.physics.core import StringModel
+from app.app.instruments.acoustic_guitar import AcousticGuitar
 
 def main() -> None:
     fs = 44100
-    guitar = StringModel(sample_rate=fs, frequency =440.0, decay_factor=0.99)
+    guitar = AcousticGuitar()
 
     print("Plucking string")
-    guitar.pluck()
+    guitar.play(440.0, velocity=1.0)
 
     def callback(outdata,frames, time ,status):
         if status:
             print(status)
 
-        audio_block = guitar.process_block(frames)
-        outdata[:] = audio_block.reshape(-1,1)
+        # Rendered straight into the device buffer
+        guitar.process_block(frames, out=outdata)
 
-    with sd.OutputStream(channels = 1, samplerate=fs, callback=callback):
+    with sd.OutputStream(channels = 2, samplerate=fs, callback=callback):
         print("Press Enter to quit ")
         input()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,20 +1,49 @@
 
-import time
 import threading
-import sounddevice as sd
 from app.app.instruments.acoustic_guitar import AcousticGuitar
+from app.app.scheduler import EventScheduler
+from app.app.command_queue import NOTE_ON
+from app.app.latency import LatencyGovernor
 from app.app.music.chords import get_chord_freqs
 from app.app.physics.core import note_to_freq
 import numpy as np
 
 class GuitarSequencer:
-    def __init__(self, guitar_model=None):
+    def __init__(self, guitar_model=None, sample_rate=44100):
         self.guitar = guitar_model if guitar_model else AcousticGuitar()
         self.stop_event = threading.Event()
-        
+        # Notes are written ahead as sample-timed events, the audio callback plays them
+        self.scheduler = EventScheduler(self.guitar.process_block, self._apply, sample_rate=sample_rate)
+        self.start = 0      # Absolute sample the timeline starts at
+        self.cursor = 0.0   # Timeline position in seconds (kept in seconds so rounding never accumulates)
+        self.events = []
+        self.captions = []  # (sample, text) printed once the audio clock reaches sample
+
+    def _apply(self, opcode, freq, velocity, sustain_time):
+        self.guitar.play(freq, velocity=velocity, sustain_time=sustain_time)
+
+    def note(self, freq, velocity, sustain_time, offset=0.0):
+        """Queues a note at cursor + offset seconds."""
+        at = self.start + self.scheduler.to_samples(self.cursor + offset)
+        self.events.append((at, NOTE_ON, freq, velocity, sustain_time))
+
+    def say(self, text):
+        """Prints text when the audio reaches the cursor."""
+        self.captions.append((self.start + self.scheduler.to_samples(self.cursor), text))
+
+    def print_due(self):
+        while self.captions and self.captions[0][0] <= self.scheduler.clock:
+            print(self.captions.pop(0)[1])
+
+    def flush(self):
+        """Hands the queued notes to the audio thread."""
+        if self.events:
+            self.scheduler.post(self.events, at=0)
+            self.events = []
+
     def play_scale_run(self, notes, duration=0.25):
         """Plays a sequence of single notes (scale)."""
-        print(f"   --> SCALE: {notes}")
+        self.say(f"   --> SCALE: {notes}")
         for note in notes:
             if self.stop_event.is_set(): return
             freq = note_to_freq(note)
@@ -22,8 +51,8 @@ class GuitarSequencer:
             # Alternate picking dynamics
             vel = np.random.uniform(0.9, 1.0)
             
-            self.guitar.play(freq, velocity=vel, sustain_time=2.0)
-            time.sleep(duration)
+            self.note(freq, vel, 2.0)
+            self.cursor += duration
 
     def play_chord(self, chord_name, duration=1.0, strum_speed=0.02, direction='down'):
         """Strums a chord pattern with direction."""
@@ -55,15 +84,12 @@ class GuitarSequencer:
             vel *= np.random.uniform(0.9, 1.1)
             vel = np.clip(vel, 0.4, 1.0) # Ensure minimal volume
             
-            self.guitar.play(freq, velocity=vel, sustain_time=4.0)
-            time.sleep(actual_strum_speed)
-            
-        remaining_time = max(0, duration - safe_strum_time)
-        time.sleep(remaining_time)
+            self.note(freq, vel, 4.0, offset=i*actual_strum_speed)
 
-    def run_playlist(self):
-        print("Starting Guitar Playlist. Press Ctrl+C to stop.")
-        
+        self.cursor += duration
+
+    def queue_playlist(self):
+        """Queues one pass of the playlist at the cursor."""
         # 1. POP PROGRESSION (Strummed)
         pop_prog = ["Am", "F_Major", "C_Major", "G_Major"]
         # Tighter Rhythm Pattern
@@ -82,35 +108,50 @@ class GuitarSequencer:
         solo_notes_2 = ["G3", "A3", "B3", "D4", "E4", "G4"] # High part
         
         beat_duration = 60.0 / 120.0 # 120 BPM base
+
+        self.say("\n--- TRACK 1: INDIE POP STRUM (x2) ---")
+        for _ in range(2):
+            for chord_name in pop_prog:
+                for dur, dir in pop_rhythm:
+                    if self.stop_event.is_set(): break
+                    # MUCH tighter strumming: 15ms per string (0.015) base
+                    base_speed = 0.015 if dur < 1.0 else 0.025
+                    self.play_chord(chord_name, duration=beat_duration*dur, strum_speed=base_speed, direction=dir)
+
+        self.say("\n--- TRACK 2: GUITAR SOLO (Scales) ---")
+        # Fast run up
+        self.play_scale_run(solo_notes_1, duration=beat_duration/2) # 8th notes
+        self.play_scale_run(solo_notes_2, duration=beat_duration/2)
+        # Hold high note
+        self.note(note_to_freq("E5"), 1.0, 4.0)
+        self.cursor += beat_duration*4
+
+        self.say("\n--- TRACK 3: SLOW ROCK (x2) ---")
+        for _ in range(2):
+            for chord_name in rock_prog:
+                self.say(f"[{chord_name}]")
+                for dur, dir in rock_rhythm:
+                    if self.stop_event.is_set(): break
+                    # Slower strum for rock
+                    self.play_chord(chord_name, duration=beat_duration*dur, strum_speed=0.06, direction=dir)
+
+    def run_playlist(self):
+        print("Starting Guitar Playlist. Press Ctrl+C to stop.")
+        # Start a little behind the audio clock so the first notes aren't late
+        self.start = self.scheduler.clock + self.scheduler.to_samples(0.1)
+        self.cursor = 0.0
         
         try:
             while not self.stop_event.is_set():
-                print("\n--- TRACK 1: INDIE POP STRUM (x2) ---")
-                for _ in range(2):
-                    for chord_name in pop_prog:
-                        # print(f"[{chord_name}]")
-                        for dur, dir in pop_rhythm:
-                            if self.stop_event.is_set(): break
-                            # MUCH tighter strumming: 15ms per string (0.015) base
-                            base_speed = 0.015 if dur < 1.0 else 0.025
-                            self.play_chord(chord_name, duration=beat_duration*dur, strum_speed=base_speed, direction=dir)
-
-                print("\n--- TRACK 2: GUITAR SOLO (Scales) ---")
-                # Fast run up
-                self.play_scale_run(solo_notes_1, duration=beat_duration/2) # 8th notes
-                self.play_scale_run(solo_notes_2, duration=beat_duration/2)
-                # Hold high note
-                self.guitar.play(note_to_freq("E5"), velocity=1.0, sustain_time=4.0)
-                time.sleep(beat_duration*4)
-
-                print("\n--- TRACK 3: SLOW ROCK (x2) ---")
-                for _ in range(2):
-                    for chord_name in rock_prog:
-                        print(f"[{chord_name}]")
-                        for dur, dir in rock_rhythm:
-                            if self.stop_event.is_set(): break
-                            # Slower strum for rock
-                            self.play_chord(chord_name, duration=beat_duration*dur, strum_speed=0.06, direction=dir)
+                self.queue_playlist()
+
+                # Queue the pass, then wait until it has nearly played out before writing the next,
+                # printing its captions as the audio gets to them
+                self.flush()
+                end = self.start + self.scheduler.to_samples(self.cursor)
+                while not self.stop_event.is_set() and end - self.scheduler.clock > self.scheduler.to_samples(1.0):
+                    self.print_due()
+                    self.stop_event.wait(0.02)
 
         except KeyboardInterrupt:
             print("\nStopping...")
@@ -118,16 +159,24 @@ class GuitarSequencer:
             self.stop_event.set()
 
 def run_standalone_demo():
+    # Imported here so the sequencer can be used for offline renders without an audio device
+    import sounddevice as sd
     print("--- Guitar Physics Engine Concert ---")
     sequencer = GuitarSequencer()
-    
+
+    # Smallest blocksize a fully sounding guitar renders safely in on this machine
+    governor = LatencyGovernor(sequencer.scheduler.process_block)
+    probe = AcousticGuitar()
+    for freq in probe.open_frequencies:
+        probe.play(freq, 1.0, sustain_time=60.0)
+    blocksize = governor.calibrate(probe.process_block)
+    print(f"Blocksize {blocksize} ({governor.latency()*1000:.1f} ms)")
+
     def callback(outdata, frames, time, status):
-        block = sequencer.guitar.process_block(frames)
-        outdata[:] = block
+        governor.process_block(frames, out=outdata)
 
     # Start Audio Stream
-    # Increased blocksize to 2048 to prevent underruns/choppiness
-    with sd.OutputStream(channels=2, callback=callback, samplerate=44100, blocksize=2048, latency='high'):
+    with sd.OutputStream(channels=2, callback=callback, samplerate=44100, blocksize=blocksize, latency='low'):
         sequencer.run_playlist()
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+import argparse
+import os
+import numpy as np
+from app.app.offline import OfflineRenderer, note_events
+from app.app.parallel import ParallelRenderer, job_seeds
+from play_demo import GuitarSequencer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the guitar to a WAV file faster than realtime.")
+    parser.add_argument("output", help="WAV file to write")
+    parser.add_argument("--notes", nargs="*", default=None,
+                        help="Notes to pluck one after another, e.g. E2 A2 D3 (default: the demo playlist)")
+    parser.add_argument("--spacing", type=float, default=0.5, help="Seconds between --notes")
+    parser.add_argument("--passes", type=int, default=1, help="Playlist passes to render")
+    parser.add_argument("--duration", type=float, default=None, help="Fixed length in seconds")
+    parser.add_argument("--chunk", type=int, default=4096, help="Samples rendered and written per chunk")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Render in a process pool with this many workers (0 = single process)")
+    parser.add_argument("--takes", type=int, default=0,
+                        help="Render this many humanized playlist takes into the output directory")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed for takes and parallel renders")
+    args = parser.parse_args()
+
+    if args.takes:
+        # Every take draws its humanization from its own seed, so takes are reproducible
+        takes = []
+        for seed in job_seeds(args.seed + 1, args.takes):
+            np.random.seed(seed)
+            sequencer = GuitarSequencer()
+            for _ in range(args.passes):
+                sequencer.queue_playlist()
+            takes.append(sequencer.events)
+        os.makedirs(args.output, exist_ok=True)
+        paths = [os.path.join(args.output, f"take_{i:03d}.wav") for i in range(args.takes)]
+        ParallelRenderer(workers=args.workers or None, seed=args.seed, chunk_size=args.chunk) \
+            .render_takes(takes, paths, duration=args.duration)
+        return
+
+    if args.workers:
+        np.random.seed(args.seed)
+        sequencer = GuitarSequencer()
+        if args.notes:
+            events = note_events([(i*args.spacing, note, 1.0, 4.0) for i, note in enumerate(args.notes)])
+        else:
+            for _ in range(args.passes):
+                sequencer.queue_playlist()
+            events = sequencer.events
+        ParallelRenderer(workers=args.workers, seed=args.seed, chunk_size=args.chunk) \
+            .render_voices(events, args.output, duration=args.duration)
+        return
+
+    if args.notes:
+        renderer = OfflineRenderer(chunk_size=args.chunk)
+        events = note_events([(i*args.spacing, note, 1.0, 4.0) for i, note in enumerate(args.notes)])
+    else:
+        sequencer = GuitarSequencer()
+        for _ in range(args.passes):
+            sequencer.queue_playlist()
+        renderer = OfflineRenderer(sequencer.guitar, chunk_size=args.chunk)
+        events = sequencer.events
+
+    renderer.render(events, args.output, duration=args.duration)
+
+if __name__ == "__main__":
+    main()
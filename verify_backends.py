@@ -0,0 +1,57 @@
+import sys
+import numpy as np
+from app.app.physics import kernels
+from app.app.physics.core import InstrumentConfig, note_to_freq
+from app.app.physics.karplus_strong import KarplusStrongAlgorithm
+from app.app.physics.dwg import DigitalWaveguideStrategy
+
+class BackendEquivalence:
+    """Renders the same plucks on every registered kernel backend and compares the audio."""
+    def __init__(self, notes=("C2", "E2", "A3", "E4", "C5", "E6"), seconds=2.0, block_size=2048, tolerance=1e-9):
+        self.fs = 44100
+        self.notes = notes
+        self.num_blocks = int(seconds*self.fs) // block_size
+        self.block_size = block_size
+        self.tolerance = tolerance
+
+    def _engines(self, freq):
+        yield "Karplus Strong", lambda: KarplusStrongAlgorithm(sample_rate=self.fs, frequency=freq)
+        for use_bridge in (True, False):
+            config = InstrumentConfig(use_bridge_output=use_bridge, pluck_width=40)
+            label = "Waveguide (bridge)" if use_bridge else "Waveguide (pickups)"
+            yield label, lambda config=config: DigitalWaveguideStrategy(sample_rate=self.fs, frequency=freq, config=config)
+
+    def render(self, backend_name, factory):
+        kernels.set_backend(backend_name)
+        kernels.get_backend().warm_up()
+        np.random.seed(1234) # Karplus-Strong excites with noise
+        string = factory()
+        string.excite(1.0)
+        return np.concatenate([string.process(self.block_size) for _ in range(self.num_blocks)])
+
+    def run(self) -> bool:
+        backends = kernels.available_backends()
+        previous = kernels.get_backend().name
+        print(f"--- Kernel backend equivalence: {backends} ---")
+        if len(backends) < 2:
+            print("Only one backend available (is numba installed?), nothing to compare.")
+            return True
+
+        reference = backends[0]
+        all_ok = True
+        try:
+            for note in self.notes:
+                freq = note_to_freq(note)
+                for label, factory in self._engines(freq):
+                    ref_audio = self.render(reference, factory)
+                    for other in backends[1:]:
+                        error = np.max(np.abs(ref_audio - self.render(other, factory)))
+                        ok = error <= self.tolerance
+                        all_ok &= ok
+                        print(f"[{'PASS' if ok else 'FAIL'}] {note:>3} {label:<20} {reference} vs {other}: max diff {error:.2e}")
+        finally:
+            kernels.set_backend(previous)
+        return all_ok
+
+if __name__ == "__main__":
+    sys.exit(0 if BackendEquivalence().run() else 1)
@@ -0,0 +1,85 @@
+import sys
+import numpy as np
+from app.app.physics import kernels
+from app.app.physics.core import InstrumentConfig, note_to_freq
+from app.app.physics.karplus_strong import KarplusStrongAlgorithm
+from app.app.physics.dwg import DigitalWaveguideStrategy
+from app.app.instruments.acoustic_guitar import AcousticGuitar
+
+class PrecisionDrift:
+    """
+    Renders long sustains in float32 and float64 and checks the float32 path neither detunes
+    nor decays differently. Pitch is compared over the last `window` seconds, where rounding
+    in the feedback loops has had the longest time to accumulate.
+    """
+    def __init__(self, notes=("E2", "A3", "E5"), seconds=15.0, sustain=12.0, block_size=512,
+                 window=2.0, max_cents=0.1, max_level_db=0.5):
+        self.fs = 44100
+        self.notes = notes
+        self.num_blocks = int(seconds*self.fs) // block_size
+        self.block_size = block_size
+        self.sustain = sustain
+        self.window = int(window*self.fs)
+        self.max_cents = max_cents
+        self.max_level_db = max_level_db
+
+    def _engines(self, freq):
+        yield "Karplus Strong", lambda dtype: KarplusStrongAlgorithm(sample_rate=self.fs, frequency=freq, dtype=dtype)
+        config = InstrumentConfig(use_bridge_output=True, pluck_width=40)
+        yield "Waveguide", lambda dtype: DigitalWaveguideStrategy(sample_rate=self.fs, frequency=freq, config=config, dtype=dtype)
+
+    def render_string(self, factory, freq, dtype) -> np.ndarray:
+        np.random.seed(1234) # Karplus-Strong excites with noise
+        string = factory(dtype)
+        string.set_frequency(freq, sustain_time=self.sustain)
+        string.excite(1.0)
+        return np.concatenate([string.process(self.block_size) for _ in range(self.num_blocks)]).astype(np.float64)
+
+    def render_guitar(self, dtype) -> np.ndarray:
+        np.random.seed(1234)
+        guitar = AcousticGuitar(dtype=dtype)
+        guitar.body.set_noise_gain(0.0) # The two precisions round the noise table differently
+        for freq in guitar.open_frequencies:
+            guitar.play(freq, 1.0, sustain_time=self.sustain)
+        return np.concatenate([guitar.process_block(self.block_size)[:, 0] for _ in range(self.num_blocks)]).astype(np.float64)
+
+    def _peak_freq(self, audio) -> float:
+        tail = audio[-self.window:] * np.hanning(self.window)
+        spectrum = np.abs(np.fft.rfft(tail, 8*self.window))
+        k = int(np.argmax(spectrum[1:])) + 1
+        alpha, beta, gamma = np.log(spectrum[k-1:k+2] + 1e-300)
+        p = 0.5*(alpha - gamma) / (alpha - 2*beta + gamma)
+        return (k + p) * self.fs / (8*self.window)
+
+    def compare(self, label, ref, test) -> bool:
+        cents = abs(1200*np.log2(self._peak_freq(test) / self._peak_freq(ref)))
+        rms = lambda x: np.sqrt(np.mean(x[-self.window:]**2)) + 1e-30
+        level_db = abs(20*np.log10(rms(test) / rms(ref)))
+        error = np.max(np.abs(test - ref)) / np.max(np.abs(ref))
+        ok = cents <= self.max_cents and level_db <= self.max_level_db
+        print(f"[{'PASS' if ok else 'FAIL'}] {label:<34} pitch {cents:.4f} cents, level {level_db:.3f} dB, "
+              f"max error {error:.1e} of peak")
+        return ok
+
+    def run(self) -> bool:
+        previous = kernels.get_backend().name
+        print(f"--- float32 vs float64 drift ({self.num_blocks*self.block_size/self.fs:.0f}s, sustain {self.sustain}s) ---")
+        all_ok = True
+        try:
+            for backend in kernels.available_backends():
+                kernels.set_backend(backend)
+                kernels.get_backend().warm_up()
+                for note in self.notes:
+                    freq = note_to_freq(note)
+                    for label, factory in self._engines(freq):
+                        ref = self.render_string(factory, freq, np.float64)
+                        test = self.render_string(factory, freq, np.float32)
+                        all_ok &= self.compare(f"{backend} {note:>3} {label}", ref, test)
+                all_ok &= self.compare(f"{backend} AcousticGuitar (6 strings)",
+                                       self.render_guitar(np.float64), self.render_guitar(np.float32))
+        finally:
+            kernels.set_backend(previous)
+        return all_ok
+
+if __name__ == "__main__":
+    sys.exit(0 if PrecisionDrift().run() else 1)